@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """SQLite с настройками для боевой нагрузки.
+
+    На каждом новом соединении выставляются SQLITE_PRAGMAS: WAL
+    разводит читателей и писателя, busy_timeout заставляет ждать
+    блокировку вместо ошибки «database is locked». Базы в памяти
+    (тесты) остаются как есть. Внутри core.db.immediate_atomic
+    транзакция начинается с BEGIN IMMEDIATE.
+    """
+
+    immediate = False
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        if not self.is_in_memory_db():
+            for pragma, value in settings.SQLITE_PRAGMAS.items():
+                conn.execute(f'PRAGMA {pragma} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        if self.immediate:
+            self.cursor().execute('BEGIN IMMEDIATE')
+        else:
+            super()._start_transaction_under_autocommit()
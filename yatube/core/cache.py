@@ -0,0 +1,233 @@
+import fcntl
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from zlib import crc32
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+
+MISSING = object()
+
+LOCK_STRIPES = 64
+
+# Состояние L1 общее для всех потоков процесса: django.core.cache.caches
+# создаёт отдельный экземпляр бэкенда на каждый поток.
+_memory = {}
+_memory_lock = threading.Lock()
+_flight_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+
+class AtomicFileBasedCache(FileBasedCache):
+    """FileBasedCache с атомарными add и incr между процессами.
+
+    В родительском классе add — это has_key и set, а incr — get
+    и set, так что два процесса могут оба «захватить» ключ или
+    потерять увеличение. Здесь обе операции выполняются под
+    flock на одном из LOCK_STRIPES файлов блокировки в каталоге
+    кэша; блокировку снимает ОС, даже если процесс упал.
+    """
+
+    @contextmanager
+    def _locked(self, key, version):
+        self._createdir()
+        stripe = crc32(self.make_key(key, version).encode()) % LOCK_STRIPES
+        path = os.path.join(self._dir, f'{stripe}.lock')
+        descriptor = os.open(path, os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            fcntl.flock(descriptor, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(descriptor)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with self._locked(key, version):
+            return super().add(key, value, timeout, version)
+
+    def incr(self, key, delta=1, version=None):
+        with self._locked(key, version):
+            return super().incr(key, delta, version)
+
+
+class TieredCache(BaseCache):
+    """Небольшой LRU в памяти процесса поверх общего кэша L2.
+
+    Записи живут в L1 не дольше L1_TIMEOUT секунд, поэтому
+    изменения, сделанные другими процессами через L2, видны
+    с этой задержкой. Ключи с префиксами из L2_ONLY (версии,
+    сессии, пользователи) в L1 не попадают и читаются из L2
+    на каждый запрос: их изменение должно быть видно сразу.
+    Единый замок get_or_compute и счётчики версий держатся
+    на add и incr L2, которые должны быть атомарными
+    (AtomicFileBasedCache, Redis, Memcached). get_or_compute
+    собирает одновременные промахи в одно вычисление и отдаёт
+    устаревшее значение, пока его пересчитывает кто-то один.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._l2_alias = options['L2']
+        self._l1_max_entries = options.get('L1_MAX_ENTRIES', 1000)
+        self._l1_timeout = options.get('L1_TIMEOUT', 5)
+        self._l2_only = tuple(options.get('L2_ONLY', ()))
+        self._stale_timeout = options.get('STALE_TIMEOUT', 60)
+        self._lock_timeout = options.get('LOCK_TIMEOUT', 10)
+        self._poll_interval = options.get('POLL_INTERVAL', 0.05)
+        with _memory_lock:
+            self._l1 = _memory.setdefault(location, OrderedDict())
+
+    @property
+    def l2(self):
+        return caches[self._l2_alias]
+
+    def _cached_locally(self, key):
+        return not key.startswith(self._l2_only)
+
+    def _l1_get(self, key):
+        with _memory_lock:
+            entry = self._l1.get(key)
+            if entry is None:
+                return MISSING
+            expires, pickled = entry
+            if expires <= time.monotonic():
+                del self._l1[key]
+                return MISSING
+            self._l1.move_to_end(key)
+        return pickle.loads(pickled)
+
+    def _l1_set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is not None and timeout <= 0:
+            self._l1_delete(key)
+            return
+        if timeout is None or timeout > self._l1_timeout:
+            timeout = self._l1_timeout
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with _memory_lock:
+            self._l1[key] = (time.monotonic() + timeout, pickled)
+            self._l1.move_to_end(key)
+            while len(self._l1) > self._l1_max_entries:
+                self._l1.popitem(last=False)
+
+    def _l1_delete(self, key):
+        with _memory_lock:
+            self._l1.pop(key, None)
+
+    def get(self, key, default=None, version=None):
+        if not self._cached_locally(key):
+            return self.l2.get(key, default, version=version)
+        local_key = self.make_key(key, version)
+        value = self._l1_get(local_key)
+        if value is not MISSING:
+            return value
+        value = self.l2.get(key, MISSING, version=version)
+        if value is MISSING:
+            return default
+        self._l1_set(local_key, value)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = {}
+        missing = []
+        for key in keys:
+            value = MISSING
+            if self._cached_locally(key):
+                value = self._l1_get(self.make_key(key, version))
+            if value is MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+        if missing:
+            from_l2 = self.l2.get_many(missing, version=version)
+            for key, value in from_l2.items():
+                if self._cached_locally(key):
+                    self._l1_set(self.make_key(key, version), value)
+            found.update(from_l2)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.l2.set(key, value, timeout, version=version)
+        if self._cached_locally(key):
+            self._l1_set(self.make_key(key, version), value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.l2.add(key, value, timeout, version=version)
+        if added and self._cached_locally(key):
+            self._l1_set(self.make_key(key, version), value, timeout)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self._l1_delete(self.make_key(key, version))
+        return self.l2.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self._l1_delete(self.make_key(key, version))
+        self.l2.delete(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        value = self.l2.incr(key, delta, version=version)
+        if self._cached_locally(key):
+            self._l1_set(self.make_key(key, version), value)
+        return value
+
+    def clear(self):
+        with _memory_lock:
+            self._l1.clear()
+        self.l2.clear()
+
+    def get_or_compute(self, key, compute, timeout=DEFAULT_TIMEOUT,
+                       version=None):
+        """Возвращает значение из кэша или вычисляет его один раз.
+
+        Свежее значение отдаётся сразу. Устаревшее ещё STALE_TIMEOUT
+        секунд отдаётся всем, кроме одного запроса, который его
+        пересчитывает. При промахе потоки процесса ждут друг друга
+        на общем замке, а процессы — на ключе-замке в L2. Если
+        compute вернул None, результат не кэшируется.
+        """
+        entry = self.get(key, version=version)
+        if entry is not None:
+            value, fresh_until = entry
+            if fresh_until > time.time() or not self._lock(key, version):
+                return value
+            return self._compute(key, compute, timeout, version)
+        with _flight_locks[hash(key) % LOCK_STRIPES]:
+            entry = self.get(key, version=version)
+            if entry is not None:
+                return entry[0]
+            if self._lock(key, version):
+                return self._compute(key, compute, timeout, version)
+            deadline = time.monotonic() + self._lock_timeout
+            while time.monotonic() < deadline:
+                time.sleep(self._poll_interval)
+                entry = self.l2.get(key, version=version)
+                if entry is not None:
+                    if self._cached_locally(key):
+                        self._l1_set(self.make_key(key, version), entry)
+                    return entry[0]
+            return self._compute(key, compute, timeout, version)
+
+    def _lock(self, key, version):
+        return self.l2.add(f'{key}:lock', 1, self._lock_timeout,
+                           version=version)
+
+    def _compute(self, key, compute, timeout, version):
+        try:
+            value = compute()
+            if value is not None:
+                if timeout is DEFAULT_TIMEOUT:
+                    timeout = self.default_timeout
+                if timeout is None:
+                    self.set(key, (value, float('inf')), None, version)
+                else:
+                    self.set(key, (value, time.time() + timeout),
+                             timeout + self._stale_timeout, version)
+            return value
+        finally:
+            self.l2.delete(f'{key}:lock', version=version)
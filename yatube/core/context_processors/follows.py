@@ -0,0 +1,8 @@
+from django.utils.functional import SimpleLazyObject
+
+from posts.follow_graph import Follows
+
+
+def follows(request):
+    user = request.user
+    return {'follows': SimpleLazyObject(lambda: Follows(user))}
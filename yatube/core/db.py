@@ -0,0 +1,24 @@
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+
+
+@contextmanager
+def immediate_atomic():
+    """atomic, который на SQLite начинается с BEGIN IMMEDIATE.
+
+    Блокировка на запись берётся в начале транзакции, а не при
+    первом INSERT после чтений: второй писатель ждёт busy_timeout
+    вместо взаимной блокировки, которую SQLite не умеет ждать.
+    Внутри уже открытой транзакции и на других базах это обычный
+    atomic. Оборачивать стоит только сами записи: проверка форм
+    и работа с файлами делаются до неё.
+    """
+    previous = getattr(connection, 'immediate', False)
+    connection.immediate = not connection.in_atomic_block
+    try:
+        with transaction.atomic():
+            connection.immediate = previous
+            yield
+    finally:
+        connection.immediate = previous
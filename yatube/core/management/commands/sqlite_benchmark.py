@@ -0,0 +1,119 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+DEFAULT_PRAGMAS = {'journal_mode': 'DELETE'}
+
+READ_SQL = 'SELECT id, text FROM posts ORDER BY id DESC LIMIT 10'
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает чтение SQLite во время всплесков записи '
+            'с настройками по умолчанию и с SQLITE_PRAGMAS')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--seconds', type=float, default=2.0)
+        parser.add_argument('--rows', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        profiles = (
+            ('по умолчанию', DEFAULT_PRAGMAS, 0, 'BEGIN'),
+            ('боевой', settings.SQLITE_PRAGMAS,
+             settings.SQLITE_PRAGMAS.get('busy_timeout', 5000) / 1000,
+             'BEGIN IMMEDIATE'),
+        )
+        for name, pragmas, timeout, begin in profiles:
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'bench.sqlite3')
+                self.prepare(path, pragmas, options['rows'])
+                quiet = self.measure(path, pragmas, timeout, begin,
+                                     options, writers=0)
+                burst = self.measure(path, pragmas, timeout, begin,
+                                     options, writers=options['writers'])
+            self.stdout.write(
+                f'{name}: чтений/с без записи {quiet["reads"]:.0f}, '
+                f'во время записи {burst["reads"]:.0f}; '
+                f'записей/с {burst["writes"]:.0f}; '
+                f'ошибок блокировки {burst["errors"]}'
+            )
+
+    def connect(self, path, pragmas, timeout):
+        conn = sqlite3.connect(path, timeout=timeout,
+                               isolation_level=None,
+                               check_same_thread=False)
+        for pragma, value in pragmas.items():
+            conn.execute(f'PRAGMA {pragma} = {value}')
+        return conn
+
+    def prepare(self, path, pragmas, rows):
+        conn = self.connect(path, pragmas, 5)
+        conn.execute('CREATE TABLE posts (id INTEGER PRIMARY KEY, text TEXT)')
+        conn.execute('BEGIN')
+        conn.executemany('INSERT INTO posts (text) VALUES (?)',
+                         (('пост',) for _ in range(rows)))
+        conn.execute('COMMIT')
+        conn.close()
+
+    def read_loop(self, conn, stop, count):
+        while not stop.is_set():
+            try:
+                conn.execute(READ_SQL).fetchall()
+            except sqlite3.OperationalError:
+                count('errors')
+            else:
+                count('reads')
+
+    def write_loop(self, conn, stop, count, begin):
+        while not stop.is_set():
+            try:
+                conn.execute(begin)
+                conn.execute('SELECT max(id) FROM posts').fetchone()
+                conn.executemany('INSERT INTO posts (text) VALUES (?)',
+                                 (('новый пост',) for _ in range(50)))
+                conn.execute('COMMIT')
+            except sqlite3.OperationalError:
+                count('errors')
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+            else:
+                count('writes')
+
+    def measure(self, path, pragmas, timeout, begin, options, writers):
+        stop = threading.Event()
+        totals = {'reads': 0, 'writes': 0, 'errors': 0}
+        lock = threading.Lock()
+
+        def count(name):
+            with lock:
+                totals[name] += 1
+
+        def run(loop, *args):
+            conn = self.connect(path, pragmas, timeout)
+            try:
+                loop(conn, stop, count, *args)
+            finally:
+                conn.close()
+
+        threads = [threading.Thread(target=run, args=(self.read_loop,))
+                   for _ in range(options['readers'])]
+        threads += [threading.Thread(target=run, args=(self.write_loop, begin))
+                    for _ in range(writers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(options['seconds'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+        seconds = options['seconds']
+        return {
+            'reads': totals['reads'] / seconds,
+            'writes': totals['writes'] / seconds,
+            'errors': totals['errors'],
+        }
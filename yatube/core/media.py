@@ -0,0 +1,133 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (FileResponse, Http404, HttpResponse,
+                         StreamingHttpResponse)
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+CHUNK_SIZE = 64 * 1024
+
+
+def _etag(stat):
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def _byte_range(header, size):
+    """Разбирает заголовок Range с одним диапазоном.
+
+    Возвращает (начало, конец) включительно, None, если заголовок
+    не поддерживается и нужно отдать файл целиком, или False,
+    если диапазон не попадает в файл.
+    """
+    match = RANGE_PATTERN.match(header.replace(' ', ''))
+    if not match:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        suffix = int(end)
+        if not suffix:
+            return False
+        return max(size - suffix, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _cache_headers(response, path, stat, etag):
+    content_type, encoding = mimetypes.guess_type(path)
+    response['Content-Type'] = content_type or 'application/octet-stream'
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Accept-Ranges'] = 'bytes'
+    response['Cache-Control'] = (
+        f'public, max-age={settings.MEDIA_CACHE_MAX_AGE}, immutable')
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    """Отдаёт загруженные картинки и миниатюры.
+
+    Имена файлов в media — хеши содержимого, поэтому ответы
+    кэшируются навсегда. В режиме MEDIA_SENDFILE_HEADER тело отдаёт
+    фронтовый прокси, а Python только проверяет путь и заголовки.
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except (SuspiciousFileOperation, ValueError):
+        raise Http404
+    try:
+        stat = os.stat(full_path)
+    except OSError:
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+    etag = _etag(stat)
+    not_modified = get_conditional_response(
+        request, etag=etag, last_modified=int(stat.st_mtime))
+    if not_modified is not None:
+        return _cache_headers(not_modified, full_path, stat, etag)
+
+    if settings.MEDIA_SENDFILE_HEADER:
+        response = _sendfile_response(path, full_path)
+    else:
+        response = _file_response(request, full_path, stat, etag)
+    return _cache_headers(response, full_path, stat, etag)
+
+
+def _sendfile_response(path, full_path):
+    response = HttpResponse()
+    if settings.MEDIA_SENDFILE_HEADER == 'X-Accel-Redirect':
+        target = settings.MEDIA_SENDFILE_PREFIX + quote(path)
+    else:
+        target = full_path
+    response[settings.MEDIA_SENDFILE_HEADER] = target
+    return response
+
+
+def _file_response(request, full_path, stat, etag):
+    byte_range = None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if 'HTTP_RANGE' in request.META and if_range in (None, etag):
+        byte_range = _byte_range(request.META['HTTP_RANGE'], stat.st_size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+        return response
+    if byte_range is None:
+        response = FileResponse(open(full_path, 'rb'))
+        response['Content-Length'] = stat.st_size
+        return response
+    start, end = byte_range
+    length = end - start + 1
+    response = StreamingHttpResponse(
+        _read_range(full_path, start, length), status=206)
+    response['Content-Length'] = length
+    response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    return response
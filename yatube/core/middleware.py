@@ -0,0 +1,48 @@
+import time
+
+from django.conf import settings
+
+from .routers import use_primary
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+
+class ReplicaStickinessMiddleware:
+    """Читает свои записи: после записи запросы идут в основную базу.
+
+    Пишущий запрос целиком работает с default и ставит куку
+    со временем, до которого чтения этого браузера не уходят
+    на реплики, — редирект после создания поста уже покажет его.
+    Пишущим считается любой небезопасный метод, а также GET
+    к представлению, помеченному core.routers.writes.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.writes = request.method not in SAFE_METHODS
+        try:
+            until = float(request.COOKIES.get(
+                settings.REPLICA_STICKY_COOKIE, 0))
+        except ValueError:
+            until = 0
+        use_primary(request.writes or until > time.time())
+        try:
+            response = self.get_response(request)
+        finally:
+            use_primary(False)
+        if request.writes:
+            response.set_cookie(
+                settings.REPLICA_STICKY_COOKIE,
+                str(time.time() + settings.REPLICA_STICKY_SECONDS),
+                max_age=settings.REPLICA_STICKY_SECONDS,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if getattr(view_func, 'writes', False):
+            request.writes = True
+            use_primary()
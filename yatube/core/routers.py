@@ -0,0 +1,60 @@
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+
+_state = threading.local()
+
+
+def use_primary(pinned=True):
+    """Закрепляет чтения текущего потока за основной базой."""
+    _state.primary = pinned
+
+
+def reading_from_primary():
+    return getattr(_state, 'primary', False)
+
+
+def writes(view):
+    """Помечает представление, которое пишет в базу даже на GET.
+
+    ReplicaStickinessMiddleware считает такой запрос пишущим:
+    он читает из default и ставит куку прилипания.
+    """
+    view.writes = True
+    return view
+
+
+@contextmanager
+def primary():
+    """Временно читает из основной базы."""
+    previous = reading_from_primary()
+    use_primary()
+    try:
+        yield
+    finally:
+        use_primary(previous)
+
+
+class PrimaryReplicaRouter:
+    """Чтения — на реплики из DATABASE_REPLICAS, записи — в default.
+
+    Пока поток закреплён за основной базой (запрос пишет или
+    пользователь недавно писал, см. ReplicaStickinessMiddleware),
+    чтения тоже идут в default. Без реплик роутер ничего не решает.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not settings.DATABASE_REPLICAS or reading_from_primary():
+            return 'default'
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
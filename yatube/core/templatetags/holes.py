@@ -0,0 +1,21 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+register = template.Library()
+
+HOLE_MARKER = '<!--hole:{}-->'
+
+
+@register.simple_tag(takes_context=True)
+def hole(context, template_name):
+    """Персональный фрагмент страницы, который не попадает в кэш.
+
+    Если запрос помечен атрибутом cache_holes, вместо фрагмента
+    выводится метка, а сам фрагмент дорисовывается при отдаче
+    страницы из кэша. Иначе шаблон подключается как обычный include.
+    """
+    request = context.get('request')
+    if getattr(request, 'cache_holes', False):
+        return mark_safe(HOLE_MARKER.format(template_name))
+    included = context.template.engine.get_template(template_name)
+    return included.render(context)
@@ -0,0 +1,307 @@
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.contrib.auth.models import User
+from django.db import connection
+from django.http import HttpResponse
+from django.test import (Client, RequestFactory, TestCase,
+                         TransactionTestCase, override_settings)
+from django.urls import reverse
+
+from .backends.sqlite3.base import DatabaseWrapper
+from .cache import AtomicFileBasedCache
+from .management.commands.sync_replicas import copy_database
+from .middleware import ReplicaStickinessMiddleware
+from .routers import PrimaryReplicaRouter, primary, use_primary
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class MediaServingTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        os.makedirs(os.path.join(TEMP_MEDIA_ROOT, 'posts'), exist_ok=True)
+        with open(os.path.join(TEMP_MEDIA_ROOT, 'posts', 'a.gif'),
+                  'wb') as file:
+            file.write(b'0123456789')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.guest_client = Client()
+
+    def test_full_file_with_cache_headers(self):
+        """Файл отдаётся целиком с ETag и вечным кэшем."""
+        response = self.guest_client.get('/media/posts/a.gif')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Content-Type'], 'image/gif')
+        self.assertIn('immutable', response['Cache-Control'])
+        repeated = self.guest_client.get(
+            '/media/posts/a.gif', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(repeated.status_code, 304)
+
+    def test_byte_ranges(self):
+        """Диапазоны байтов отдаются с кодом 206 или 416."""
+        cases = {
+            'bytes=2-4': (206, b'234', 'bytes 2-4/10'),
+            'bytes=7-': (206, b'789', 'bytes 7-9/10'),
+            'bytes=-2': (206, b'89', 'bytes 8-9/10'),
+            'bytes=20-': (416, b'', 'bytes */10'),
+        }
+        for header, (status, body, content_range) in cases.items():
+            with self.subTest(header=header):
+                response = self.guest_client.get(
+                    '/media/posts/a.gif', HTTP_RANGE=header)
+                self.assertEqual(response.status_code, status)
+                self.assertEqual(response['Content-Range'], content_range)
+                if response.streaming:
+                    self.assertEqual(
+                        b''.join(response.streaming_content), body)
+
+    def test_missing_and_outside_paths(self):
+        """Несуществующие файлы и пути вне MEDIA_ROOT дают 404."""
+        for path in ('/media/posts/none.gif', '/media/../manage.py',
+                     '/media/posts/'):
+            with self.subTest(path=path):
+                response = self.guest_client.get(path)
+                self.assertEqual(response.status_code, 404)
+
+    @override_settings(MEDIA_SENDFILE_HEADER='X-Accel-Redirect')
+    def test_accel_redirect(self):
+        """В режиме X-Accel-Redirect тело отдаёт прокси."""
+        response = self.guest_client.get('/media/posts/a.gif')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'],
+                         '/internal-media/posts/a.gif')
+        self.assertEqual(response.content, b'')
+
+
+class TieredCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_concurrent_misses_computed_once(self):
+        """Одновременные промахи вычисляют значение один раз."""
+        calls = []
+        results = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'готово'
+
+        def worker():
+            results.append(cache.get_or_compute('flight', compute, 60))
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['готово'] * 4)
+
+    def test_stale_value_served_while_refreshing(self):
+        """Пока значение пересчитывают, остальным отдаётся старое."""
+        cache.get_or_compute('stale', lambda: 'старое', 0)
+        cache.l2.add('stale:lock', 1)
+        self.assertEqual(
+            cache.get_or_compute('stale', lambda: 'новое', 0), 'старое')
+        cache.l2.delete('stale:lock')
+        self.assertEqual(
+            cache.get_or_compute('stale', lambda: 'новое', 0), 'новое')
+
+    def test_l1_survives_until_timeout(self):
+        """L1 отдаёт значение, пока не истёк L1_TIMEOUT."""
+        cache.set('tier', 1)
+        cache.l2.delete('tier')
+        self.assertEqual(cache.get('tier'), 1)
+        cache.delete('tier')
+        self.assertIsNone(cache.get('tier'))
+
+    def test_l2_only_keys_skip_l1(self):
+        """Версии и сессии, изменённые другим процессом, видны сразу."""
+        for prefix in settings.CACHES['default']['OPTIONS']['L2_ONLY']:
+            key = f'{prefix}1'
+            with self.subTest(key=key):
+                cache.set(key, 1)
+                cache.l2.set(key, 2)
+                self.assertEqual(cache.get(key), 2)
+                self.assertEqual(cache.get_many([key]), {key: 2})
+                cache.l2.delete(key)
+                self.assertIsNone(cache.get(key))
+
+
+class AtomicFileBasedCacheTests(TestCase):
+    """add и incr проверяются из отдельных процессов, как у воркеров."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.cache = AtomicFileBasedCache(self.directory, {})
+
+    def run_processes(self, target, *args, count=4):
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=target, args=args)
+                     for _ in range(count)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+    def test_incr_does_not_lose_updates(self):
+        """Параллельные incr не теряют увеличений."""
+        self.cache.set('version', 0, None)
+        self.run_processes(_bump, self.directory)
+        self.assertEqual(self.cache.get('version'), 200)
+
+    def test_add_succeeds_once(self):
+        """Ключ-замок через add получает ровно один процесс."""
+        self.run_processes(_take_lock, self.directory, count=8)
+        self.assertEqual(self.cache.get('winners'), 1)
+
+
+def _bump(directory):
+    cache = AtomicFileBasedCache(directory, {})
+    for _ in range(50):
+        cache.incr('version')
+
+
+def _take_lock(directory):
+    cache = AtomicFileBasedCache(directory, {})
+    cache.add('winners', 0, None)
+    if cache.add('lock', 1, 10):
+        cache.incr('winners')
+
+
+class SQLiteProfileTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'db.sqlite3')
+        self.wrapper = DatabaseWrapper(
+            dict(connection.settings_dict, NAME=self.path), 'profile')
+
+    def tearDown(self):
+        self.wrapper.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_pragmas_on_new_connection(self):
+        """Новое соединение к файлу получает WAL и busy_timeout."""
+        with self.wrapper.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0],
+                             settings.SQLITE_PRAGMAS['busy_timeout'])
+
+    def test_immediate_transaction_takes_write_lock(self):
+        """BEGIN IMMEDIATE сразу закрывает запись другим соединениям."""
+        self.wrapper.ensure_connection()
+        self.wrapper.immediate = True
+        self.wrapper._start_transaction_under_autocommit()
+        other = sqlite3.connect(self.path, timeout=0)
+        try:
+            with self.assertRaises(sqlite3.OperationalError):
+                other.execute('BEGIN IMMEDIATE')
+        finally:
+            other.close()
+            self.wrapper.connection.rollback()
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+
+    def tearDown(self):
+        use_primary(False)
+
+    def test_reads_go_to_replica_unless_pinned(self):
+        """Чтения уходят на реплику, записи и закреплённые — в default."""
+        self.assertEqual(self.router.db_for_read(User), 'replica')
+        self.assertEqual(self.router.db_for_write(User), 'default')
+        use_primary()
+        self.assertEqual(self.router.db_for_read(User), 'default')
+        self.assertFalse(self.router.allow_migrate('replica', 'posts'))
+
+    def test_reads_after_write_stick_to_primary(self):
+        """После записи чтения браузера идут в default до конца окна."""
+        seen = []
+
+        def remember(request):
+            seen.append(self.router.db_for_read(User))
+            return HttpResponse()
+
+        middleware = ReplicaStickinessMiddleware(remember)
+        factory = RequestFactory()
+        response = middleware(factory.post('/create/'))
+        cookie = response.cookies[settings.REPLICA_STICKY_COOKIE].value
+        request = factory.get('/')
+        request.COOKIES[settings.REPLICA_STICKY_COOKIE] = cookie
+        middleware(request)
+        with mock.patch('core.middleware.time.time',
+                        return_value=time.time() + 60):
+            request = factory.get('/')
+            request.COOKIES[settings.REPLICA_STICKY_COOKIE] = cookie
+            middleware(request)
+        middleware(factory.get('/'))
+        self.assertEqual(seen, ['default', 'default', 'replica', 'replica'])
+
+
+class FollowRoutingTests(TransactionTestCase):
+    """Граф подписок меняется после коммита, поэтому без обёртки
+    TestCase в транзакцию."""
+
+    def tearDown(self):
+        use_primary(False)
+
+    def test_follow_redirect_reads_from_primary(self):
+        """GET-подписка считается записью: профиль после редиректа
+        читается из default, а не с несуществующей реплики."""
+        reader = User.objects.create_user(username='reader')
+        author = User.objects.create_user(username='author')
+        client = Client()
+        with primary():
+            client.force_login(reader)
+        for name in ('posts:profile_follow', 'posts:profile_unfollow'):
+            with self.subTest(name=name):
+                response = client.get(
+                    reverse(name, kwargs={'username': author.username}),
+                    follow=True)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn(settings.REPLICA_STICKY_COOKIE, client.cookies)
+                self.assertEqual(response.context['following'],
+                                 name == 'posts:profile_follow')
+
+
+class SyncReplicasTests(TestCase):
+    def test_copy_database(self):
+        """Backup API переносит данные в файл реплики."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        source = os.path.join(directory, 'primary.sqlite3')
+        target = os.path.join(directory, 'replica.sqlite3')
+        conn = sqlite3.connect(source)
+        conn.execute('CREATE TABLE posts (text TEXT)')
+        conn.execute("INSERT INTO posts VALUES ('пост')")
+        conn.commit()
+        conn.close()
+        copy_database(source, target)
+        conn = sqlite3.connect(target)
+        self.assertEqual(conn.execute('SELECT text FROM posts').fetchall(),
+                         [('пост',)])
+        conn.close()
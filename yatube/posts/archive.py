@@ -0,0 +1,148 @@
+from heapq import merge
+from operator import attrgetter
+
+from django.core.cache import cache
+from django.db import router
+from django.db.models import Count, Max, Min
+from django.http import Http404
+
+from core.db import immediate_atomic
+from core.routers import primary
+
+from . import search
+from .models import ArchivedComment, ArchivedPost, Comment, Post, TimelineEntry
+from .utils import (FEED_VERSION_KEY, POST_COUNT_VERSION_KEY, batches,
+                    bump_version)
+
+ARCHIVE_BOUNDARY_KEY = 'posts:archive_boundary'
+
+POST_FIELDS = ('id', 'text', 'pub_date', 'updated', 'author_id', 'group_id',
+               'image', 'comment_count')
+COMMENT_FIELDS = ('id', 'post_id', 'author_id', 'text', 'created')
+
+
+def archive_boundary():
+    """Дата самого нового архивного поста или None, если архив пуст.
+
+    Хранится в кэше без срока и сбрасывается после каждой пачки
+    archive_posts.
+    """
+    def newest():
+        return (ArchivedPost.objects.aggregate(
+            newest=Max('pub_date'))['newest'],)
+    return cache.get_or_set(ARCHIVE_BOUNDARY_KEY, newest, None)[0]
+
+
+def _copy(source, model, fields, batch_size):
+    model.objects.bulk_create(
+        (model(**dict(zip(fields, row)))
+         for row in source.values_list(*fields).order_by()),
+        batch_size=batch_size,
+    )
+
+
+def archive_posts(before, batch_size):
+    """Переносит посты, опубликованные раньше before, в архив.
+
+    Каждая пачка переезжает в своей транзакции вместе
+    с комментариями, записи лент подписок и поискового индекса
+    удаляются. Строки удаляются без сигналов: счётчик постов
+    автора и ссылка на картинку переходят к архивной копии.
+    Пачки и строки для копирования читаются из основной базы:
+    реплика может отставать. Возвращает число перенесённых постов.
+    """
+    moved = 0
+    with primary():
+        for ids in batches(Post.objects.filter(pub_date__lt=before),
+                           batch_size):
+            _archive_batch(ids, batch_size)
+            moved += len(ids)
+    return moved
+
+
+def _archive_batch(ids, batch_size):
+    posts = Post.objects.filter(pk__in=ids)
+    comments = Comment.objects.filter(post__in=ids)
+    with immediate_atomic():
+        _copy(posts, ArchivedPost, POST_FIELDS, batch_size)
+        _copy(comments, ArchivedComment, COMMENT_FIELDS, batch_size)
+        TimelineEntry.objects.filter(post__in=ids).delete()
+        # Без сигналов и каскадов: они уже отработаны копированием.
+        # _raw_delete берёт базу явно, а queryset.db — база чтения.
+        comments._raw_delete(router.db_for_write(Comment))
+        posts._raw_delete(router.db_for_write(Post))
+        search.unindex_posts(ids)
+    cache.delete(ARCHIVE_BOUNDARY_KEY)
+    bump_version(FEED_VERSION_KEY)
+    bump_version(POST_COUNT_VERSION_KEY)
+
+
+def find_post(post_id, *related):
+    """Пост из горячей таблицы, а если его там нет — из архива."""
+    for model in (Post, ArchivedPost):
+        post = model.objects.select_related(*related).filter(
+            pk=post_id).first()
+        if post is not None:
+            return post
+    raise Http404
+
+
+class FallThrough:
+    """Горячие и архивные посты одной выборкой.
+
+    Умеет то, что нужно пагинаторам: filter, order_by, count
+    и срезы. Обычно горячие посты новее архива, и при сортировке
+    по убыванию даты архив не читается, пока последняя строка
+    среза новее archive_boundary(). За концом горячих постов
+    архив читается срезом со сдвигом на их число. Только если
+    выборки пересекаются по дате (импорт старых постов мимо
+    архива) или сортировка по возрастанию, обе читаются до конца
+    среза и сливаются по ключу сортировки.
+    """
+    ordered = True
+
+    def __init__(self, hot, cold, fields=('-pub_date', '-pk')):
+        self.hot = hot
+        self.cold = cold
+        self.fields = fields
+
+    def filter(self, *args, **kwargs):
+        return FallThrough(self.hot.filter(*args, **kwargs),
+                           self.cold.filter(*args, **kwargs),
+                           self.fields)
+
+    def order_by(self, *fields):
+        return FallThrough(self.hot.order_by(*fields),
+                           self.cold.order_by(*fields), fields)
+
+    @property
+    def query(self):
+        return f'{self.hot.query}\n{self.cold.query}'
+
+    def count(self):
+        count = self.hot.count()
+        if archive_boundary() is not None:
+            count += self.cold.count()
+        return count
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice) or item.stop is None:
+            raise TypeError('FallThrough поддерживает только срезы')
+        boundary = archive_boundary()
+        if boundary is None:
+            return list(self.hot[item])
+        descending = self.fields[0].startswith('-')
+        if descending:
+            start = item.start or 0
+            rows = list(self.hot[item])
+            if (rows and len(rows) == item.stop - start
+                    and rows[-1].pub_date > boundary):
+                return rows
+            hot = self.hot.aggregate(count=Count('pk'),
+                                     oldest=Min('pub_date'))
+            if hot['oldest'] is None or hot['oldest'] > boundary:
+                return rows + list(self.cold[max(start - hot['count'], 0):
+                                             item.stop - hot['count']])
+        key = attrgetter(*(field.lstrip('-') for field in self.fields))
+        return list(merge(self.hot[:item.stop], self.cold[:item.stop],
+                          key=key, reverse=descending))[item]
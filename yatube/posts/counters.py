@@ -0,0 +1,101 @@
+from django.db import transaction
+from django.db.models import Count, F
+
+from .models import ArchivedPost, Comment, Follow, Post, User, UserStats
+from .utils import batches
+
+
+def change_user_stats(user_id, **deltas):
+    """Атомарно сдвигает счётчики пользователя на заданные величины.
+
+    Отсутствующая строка создаётся только при увеличении счётчиков:
+    уменьшение приходит и при каскадном удалении пользователя.
+    """
+    updates = {field: F(field) + delta for field, delta in deltas.items()}
+    if UserStats.objects.filter(user_id=user_id).update(**updates):
+        return
+    if all(delta > 0 for delta in deltas.values()):
+        UserStats.objects.get_or_create(user_id=user_id)
+        UserStats.objects.filter(user_id=user_id).update(**updates)
+
+
+def change_comment_count(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comment_count=F('comment_count') + delta
+    )
+
+
+def get_stats(user):
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        return UserStats(user=user)
+
+
+def _grouped_counts(queryset, field):
+    return dict(
+        queryset.order_by().values(field).annotate(
+            total=Count('pk')
+        ).values_list(field, 'total')
+    )
+
+
+def reconcile_users(user_ids):
+    """Пересчитывает счётчики пачки пользователей, возвращает
+    число исправленных строк."""
+    posts = _grouped_counts(Post.objects.filter(author__in=user_ids),
+                            'author')
+    archived = _grouped_counts(
+        ArchivedPost.objects.filter(author__in=user_ids), 'author')
+    followers = _grouped_counts(Follow.objects.filter(author__in=user_ids),
+                                'author')
+    following = _grouped_counts(Follow.objects.filter(user__in=user_ids),
+                                'user')
+    existing = UserStats.objects.in_bulk(user_ids)
+    fixed = 0
+    with transaction.atomic():
+        for user_id in user_ids:
+            actual = {
+                'posts_count': (posts.get(user_id, 0)
+                                + archived.get(user_id, 0)),
+                'followers_count': followers.get(user_id, 0),
+                'following_count': following.get(user_id, 0),
+            }
+            stats = existing.get(user_id)
+            if stats is None:
+                UserStats.objects.create(user_id=user_id, **actual)
+                fixed += 1
+            elif any(getattr(stats, field) != value
+                     for field, value in actual.items()):
+                UserStats.objects.filter(user_id=user_id).update(**actual)
+                fixed += 1
+    return fixed
+
+
+def reconcile_posts(post_ids):
+    """Пересчитывает число комментариев пачки постов, возвращает
+    число исправленных строк."""
+    comments = _grouped_counts(Comment.objects.filter(post__in=post_ids),
+                               'post')
+    stored = Post.objects.filter(pk__in=post_ids).values_list(
+        'pk', 'comment_count')
+    fixed = 0
+    with transaction.atomic():
+        for post_id, comment_count in stored:
+            actual = comments.get(post_id, 0)
+            if comment_count != actual:
+                Post.objects.filter(pk=post_id).update(comment_count=actual)
+                fixed += 1
+    return fixed
+
+
+def reconcile(batch_size):
+    fixed_users = sum(
+        reconcile_users(ids)
+        for ids in batches(User.objects.all(), batch_size)
+    )
+    fixed_posts = sum(
+        reconcile_posts(ids)
+        for ids in batches(Post.objects.all(), batch_size)
+    )
+    return fixed_users, fixed_posts
@@ -0,0 +1,69 @@
+from datetime import datetime, timezone
+from hashlib import md5
+
+from django.conf import settings
+
+from .models import ArchivedPost, Post
+from .thumbnails import resolve
+from .utils import (FEED_VERSION_KEY, POST_COUNT_VERSION_KEY, changed_at,
+                    get_version)
+
+
+def _etag(*parts):
+    return md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def feed_etag(request, *args, **kwargs):
+    """Версия лент меняется при любом изменении постов и групп."""
+    return _etag(get_version(FEED_VERSION_KEY), request.user.pk)
+
+
+def profile_etag(request, username):
+    """К версии лент добавляется версия счётчиков постов и подписок."""
+    return _etag(get_version(FEED_VERSION_KEY),
+                 get_version(POST_COUNT_VERSION_KEY), request.user.pk)
+
+
+def post_etag(request, post_id):
+    """Строится по одной строке поста без рендера шаблона.
+
+    Число комментариев меняется при добавлении и удалении,
+    CSRF-кука учитывается из-за формы комментария, готовность
+    миниатюр — из-за заглушки на месте картинки. Поста нет
+    в горячей таблице — ищется в архиве.
+    """
+    for model in (Post, ArchivedPost):
+        row = model.objects.filter(pk=post_id).values_list(
+            'updated', 'comment_count', 'group__slug', 'group__title',
+            'image'
+        ).order_by().first()
+        if row is not None:
+            image = row[-1]
+            ready = bool(image) and image in resolve([image], 'feed')
+            return _etag(*row, ready, get_version(POST_COUNT_VERSION_KEY),
+                         request.user.pk,
+                         request.COOKIES.get(settings.CSRF_COOKIE_NAME))
+    return None
+
+
+def _modified(*keys):
+    return datetime.fromtimestamp(max(changed_at(key) for key in keys),
+                                  timezone.utc)
+
+
+def feed_last_modified(request, *args, **kwargs):
+    """Время последнего изменения постов, комментариев и групп.
+
+    Берётся время смены версии, а не Max(updated): так учитываются
+    и удаления, которые не оставляют строк с новой датой.
+    """
+    return _modified(FEED_VERSION_KEY)
+
+
+def profile_last_modified(request, username):
+    return _modified(FEED_VERSION_KEY, POST_COUNT_VERSION_KEY)
+
+
+def post_last_modified(request, post_id):
+    """Страница поста показывает число постов автора."""
+    return _modified(FEED_VERSION_KEY, POST_COUNT_VERSION_KEY)
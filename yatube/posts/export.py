@@ -0,0 +1,121 @@
+import csv
+import json
+import zlib
+
+from .utils import batches
+
+CSV_COLUMNS = ('id', 'pub_date', 'author', 'group', 'text', 'image',
+               'comments')
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def accepts_gzip(accept_encoding):
+    """Принимает ли клиент gzip по заголовку Accept-Encoding.
+
+    Учитываются q-значения: gzip;q=0 — явный отказ, а gzip
+    без упоминания разрешает только * с ненулевым q.
+    """
+    weights = {}
+    for part in accept_encoding.split(','):
+        coding, *params = part.split(';')
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        weights[coding.strip().lower()] = quality
+    return weights.get('gzip', weights.get('*', 0.0)) > 0
+
+
+def export_rows(querysets, chunk_size):
+    """Посты с комментариями словарями, пачками по pk.
+
+    querysets — выборки горячих и архивных постов, они выгружаются
+    по очереди. На пачку уходит два запроса: посты и все их
+    комментарии, в памяти держится только текущая пачка.
+    """
+    for queryset in querysets:
+        yield from _export_rows(queryset, chunk_size)
+
+
+def _export_rows(queryset, chunk_size):
+    model = queryset.model
+    comment_model = model.comments.rel.related_model
+    for ids in batches(queryset, chunk_size):
+        comments = {}
+        for post_id, *comment in comment_model.objects.filter(
+                post__in=ids).order_by('created', 'pk').values_list(
+                'post', 'pk', 'author__username', 'text', 'created'):
+            comments.setdefault(post_id, []).append(comment)
+        posts = model.objects.filter(pk__in=ids).order_by('pk').values_list(
+            'pk', 'pub_date', 'author__username', 'group__slug', 'text',
+            'image')
+        for pk, pub_date, author, group, text, image in posts:
+            yield {
+                'id': pk,
+                'pub_date': pub_date.isoformat(),
+                'author': author,
+                'group': group,
+                'text': text,
+                'image': image or None,
+                'comments': [
+                    {'id': comment_id, 'author': comment_author,
+                     'text': comment_text, 'created': created.isoformat()}
+                    for comment_id, comment_author, comment_text, created
+                    in comments.get(pk, ())
+                ],
+            }
+
+
+class _Line:
+    """Файлоподобный объект, который возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+def csv_lines(rows):
+    writer = csv.writer(_Line())
+    yield writer.writerow(CSV_COLUMNS)
+    for row in rows:
+        row = dict(row, comments=json.dumps(row['comments'],
+                                            ensure_ascii=False))
+        yield writer.writerow([row[column] for column in CSV_COLUMNS])
+
+
+FORMATS = {
+    'ndjson': ndjson_lines,
+    'csv': csv_lines,
+}
+
+
+def encode(lines, compress=False):
+    """Кодирует строки в UTF-8 и при необходимости сжимает gzip на лету."""
+    if not compress:
+        for line in lines:
+            yield line.encode()
+        return
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for line in lines:
+        chunk = compressor.compress(line.encode())
+        if chunk:
+            yield chunk
+    yield compressor.flush()
+
+
+def export(querysets, export_format, chunk_size, compress=False):
+    """Поток байтов выгрузки постов в формате export_format."""
+    return encode(FORMATS[export_format](export_rows(querysets, chunk_size)),
+                  compress)
@@ -0,0 +1,157 @@
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core.routers import primary
+
+from .models import Follow
+
+FOLLOWING = 'following'
+FOLLOWERS = 'followers'
+
+
+def _version_key(kind, user_id):
+    return f'posts:follow_graph:{kind}:{user_id}'
+
+
+def _contains(ids, value):
+    index = bisect_left(ids, value)
+    return index < len(ids) and ids[index] == value
+
+
+class FollowGraph:
+    """Подписки пользователей в памяти процесса.
+
+    Для каждого пользователя лениво загружаются отсортированные
+    массивы array('i') с id авторов, на которых он подписан,
+    и с id подписчиков. Проверки подписки — бинарный поиск.
+    Изменения приходят из сигналов Follow после коммита и правят
+    массивы на месте; метка версии в кэше подсказывает другим
+    процессам, что их копию пора перечитать. Копия перечитывается
+    из основной базы: реплика может ещё не видеть подписку. Метки
+    случайные, а не счётчики: после очистки кэша старая копия
+    не совпадёт с новой меткой.
+    Число загруженных пользователей ограничено FOLLOW_GRAPH_MAX_USERS.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _ids(self, kind, user_id):
+        key = _version_key(kind, user_id)
+        version = cache.get(key)
+        if version is None:
+            cache.add(key, uuid4().hex, None)
+            version = cache.get(key)
+        with self._lock:
+            entry = self._entries.get((kind, user_id))
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end((kind, user_id))
+                return entry[1]
+        if kind == FOLLOWING:
+            rows = Follow.objects.filter(user_id=user_id).order_by(
+                'author_id').values_list('author_id', flat=True)
+        else:
+            rows = Follow.objects.filter(author_id=user_id).order_by(
+                'user_id').values_list('user_id', flat=True)
+        with primary():
+            ids = array('i', rows)
+        with self._lock:
+            self._entries[(kind, user_id)] = (version, ids)
+            while len(self._entries) > settings.FOLLOW_GRAPH_MAX_USERS:
+                self._entries.popitem(last=False)
+        return ids
+
+    def _change(self, kind, user_id, other_id, added):
+        key = _version_key(kind, user_id)
+        previous = cache.get(key)
+        version = uuid4().hex
+        cache.set(key, version, None)
+        with self._lock:
+            entry = self._entries.pop((kind, user_id), None)
+            if entry is None or previous is None or entry[0] != previous:
+                return
+            ids = array('i', entry[1])
+            index = bisect_left(ids, other_id)
+            present = index < len(ids) and ids[index] == other_id
+            if added and not present:
+                ids.insert(index, other_id)
+            elif not added and present:
+                del ids[index]
+            self._entries[(kind, user_id)] = (version, ids)
+
+    def forget(self, user_ids, author_ids):
+        """Сбрасывает метки версий после записи подписок в обход
+        сигналов: все процессы перечитают эти массивы из базы."""
+        cache.delete_many(
+            [_version_key(FOLLOWING, user_id) for user_id in user_ids]
+            + [_version_key(FOLLOWERS, author_id) for author_id in author_ids]
+        )
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def following(self, user_id):
+        return self._ids(FOLLOWING, user_id)
+
+    def followers(self, user_id):
+        return self._ids(FOLLOWERS, user_id)
+
+    def is_following(self, user_id, author_id):
+        return _contains(self.following(user_id), author_id)
+
+    def followed_among(self, user_id, author_ids):
+        """Какие из author_ids есть в подписках пользователя."""
+        following = self.following(user_id)
+        return {
+            author_id for author_id in author_ids
+            if _contains(following, author_id)
+        }
+
+    def common_following(self, user_id, other_id):
+        """Общие подписки двух пользователей, O(m log n)."""
+        first, second = self.following(user_id), self.following(other_id)
+        if len(first) > len(second):
+            first, second = second, first
+        return [author_id for author_id in first
+                if _contains(second, author_id)]
+
+    def add(self, user_id, author_id):
+        self._change(FOLLOWING, user_id, author_id, True)
+        self._change(FOLLOWERS, author_id, user_id, True)
+
+    def remove(self, user_id, author_id):
+        self._change(FOLLOWING, user_id, author_id, False)
+        self._change(FOLLOWERS, author_id, user_id, False)
+
+
+follow_graph = FollowGraph()
+
+
+class Follows:
+    """Доступ к подпискам текущего пользователя из шаблонов.
+
+    {% if post.author_id in follows %} или
+    {% if author in follows %}; для анонимов всегда пусто.
+    """
+
+    def __init__(self, user):
+        self._user_id = user.pk if user.is_authenticated else None
+
+    def __contains__(self, author):
+        if self._user_id is None:
+            return False
+        author_id = getattr(author, 'pk', author)
+        return follow_graph.is_following(self._user_id, author_id)
+
+    def __len__(self):
+        if self._user_id is None:
+            return 0
+        return len(follow_graph.following(self._user_id))
@@ -0,0 +1,71 @@
+import posixpath
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from sorl.thumbnail import delete as delete_thumbnails
+
+from core.db import immediate_atomic
+
+from .models import StoredImage, ThumbnailSet
+from .storage import content_storage
+from .thumbnails import THUMBNAIL_PRESETS, _cache_key
+
+
+def acquire(name):
+    """Учитывает ещё одну ссылку поста на файл картинки."""
+    if not name:
+        return
+    updated = StoredImage.objects.filter(name=name).update(
+        references=F('references') + 1)
+    if not updated:
+        _, created = StoredImage.objects.get_or_create(
+            name=name, defaults={'references': 1})
+        if not created:
+            StoredImage.objects.filter(name=name).update(
+                references=F('references') + 1)
+
+
+def restore(name, content):
+    """Возвращает файл, который collect удалил между записью
+    в хранилище и acquire.
+
+    Вызывается после acquire в той же транзакции: collect удаляет
+    строку и файл под той же блокировкой на запись, поэтому здесь
+    файл либо на месте, либо уже удалён целиком.
+    """
+    if name and not content_storage.exists(name):
+        # Хранилище само добавит каталог по хешу: posts/ab/abc.gif
+        # сохраняется как posts/abc.gif.
+        directory = posixpath.dirname(posixpath.dirname(name))
+        content_storage.save(
+            posixpath.join(directory, posixpath.basename(name)), content)
+
+
+def release(name):
+    """Снимает ссылку; файл без ссылок удаляется после коммита."""
+    if not name:
+        return
+    StoredImage.objects.filter(name=name).update(
+        references=F('references') - 1)
+    transaction.on_commit(lambda: collect(name))
+
+
+def collect(name):
+    """Удаляет файл, его миниатюры и ThumbnailSet, если ссылок нет.
+
+    Строка StoredImage удаляется условно, поэтому параллельная
+    загрузка того же содержимого, успевшая взять ссылку, файл
+    сохранит. Строка и файл удаляются в одной транзакции
+    immediate_atomic, чтобы restore не увидел их по отдельности.
+    """
+    with immediate_atomic():
+        deleted, _ = StoredImage.objects.filter(
+            name=name, references__lte=0).delete()
+        if not deleted:
+            return
+        content_storage.delete(name)
+    delete_thumbnails(name, delete_file=False)
+    ThumbnailSet.objects.filter(image=name).delete()
+    cache.delete_many(
+        [_cache_key(name, preset_name) for preset_name in THUMBNAIL_PRESETS])
@@ -0,0 +1,263 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.db import immediate_atomic
+
+from . import counters, search, timeline
+from .follow_graph import follow_graph
+from .models import (ArchivedComment, ArchivedPost, Comment, Follow, Group,
+                     ImportCheckpoint, ImportedObject, Post)
+from .utils import FEED_VERSION_KEY, POST_COUNT_VERSION_KEY, bump_version
+
+User = get_user_model()
+
+# Порядок обработки типов внутри пачки: ссылки идут только назад.
+KINDS = ('user', 'group', 'post', 'comment', 'follow')
+
+ARCHIVES = {Post: ArchivedPost, Comment: ArchivedComment}
+
+# Поля auto_now и auto_now_add, которые bulk_create перезаписывает
+# текущим временем; даты из файла возвращаются после вставки.
+DATE_FIELDS = {
+    Post: ('pub_date', 'updated'),
+    Comment: ('created',),
+}
+
+
+def parse_date(value):
+    if not value:
+        return timezone.now()
+    date = parse_datetime(value)
+    if date is None:
+        raise ValidationError(f'Неверная дата: {value}')
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date)
+    return date
+
+
+def read_batches(stream, start_line, batch_size):
+    """Отдаёт пачки (номер строки, строка), пропуская уже загруженные."""
+    batch = []
+    for number, line in enumerate(stream, 1):
+        if number <= start_line:
+            continue
+        batch.append((number, line))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Importer:
+    """Потоковый импорт NDJSON с пользователями, группами, постами,
+    комментариями и подписками.
+
+    Строки читаются пачками, проверяются clean_fields и пишутся
+    bulk_create в одной транзакции вместе с номером последней
+    строки в ImportCheckpoint, поэтому после падения импорт
+    продолжается с первой незагруженной пачки. Сигналы не
+    срабатывают: счётчики, поисковый индекс и ленты подписок
+    пересобираются один раз в finish(), там же сбрасываются
+    версии кэша лент и счётчиков.
+    """
+
+    def __init__(self, source, batch_size=1000, on_error=None):
+        self.source = source
+        self.batch_size = batch_size
+        self.on_error = on_error or (lambda line, message: None)
+        self.imported = dict.fromkeys(KINDS, 0)
+        self.skipped = 0
+
+    def run(self, stream):
+        checkpoint, _ = ImportCheckpoint.objects.get_or_create(
+            source=self.source)
+        if not checkpoint.finished:
+            for batch in read_batches(stream, checkpoint.line,
+                                      self.batch_size):
+                self.import_batch(batch)
+            self.finish()
+        return self.imported
+
+    def import_batch(self, batch):
+        records = {kind: [] for kind in KINDS}
+        for number, line in batch:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                kind = record['type']
+                if kind not in records:
+                    raise ValueError(f'неизвестный тип {kind}')
+            except (ValueError, KeyError, TypeError) as error:
+                self.on_error(number, f'не разобрать запись: {error}')
+                continue
+            records[kind].append((number, record))
+        with immediate_atomic():
+            for kind in KINDS:
+                if records[kind]:
+                    getattr(self, f'import_{kind}s')(records[kind])
+            ImportCheckpoint.objects.filter(source=self.source).update(
+                line=batch[-1][0])
+
+    def finish(self):
+        """Пересобирает всё, что обычно обновляют сигналы."""
+        counters.reconcile(self.batch_size)
+        timeline.rebuild(self.batch_size)
+        if search.fts_enabled():
+            search.rebuild_index(self.batch_size)
+        bump_version(FEED_VERSION_KEY)
+        bump_version(POST_COUNT_VERSION_KEY)
+        ImportCheckpoint.objects.filter(source=self.source).update(
+            finished=True)
+
+    def lookup(self, kind, external_ids):
+        return dict(ImportedObject.objects.filter(
+            source=self.source, kind=kind, external_id__in=external_ids
+        ).values_list('external_id', 'object_id'))
+
+    def build(self, kind, model, records, make):
+        """Проверяет записи и готовит объекты с заранее выданными pk.
+
+        pk выдаются от текущего максимума с учётом архива:
+        транзакция начата с BEGIN IMMEDIATE, так что параллельных
+        вставок нет, а связи внутри пачки известны до записи.
+        """
+        next_pk = max(
+            table.objects.aggregate(top=Max('pk'))['top'] or 0
+            for table in (model, ARCHIVES.get(model, model))
+        ) + 1
+        known = self.lookup(kind, [str(record.get('id')) for _, record in
+                                   records])
+        objects, mapped = [], []
+        for number, record in records:
+            external_id = str(record.get('id'))
+            if external_id in known:
+                self.skipped += 1
+                continue
+            try:
+                if record.get('id') is None:
+                    raise ValidationError('нет id')
+                obj = make(record)
+                if obj.pk is None:
+                    obj.pk = next_pk
+                    next_pk += 1
+                    obj.clean_fields(exclude=['author', 'group', 'post',
+                                              'user', 'password'])
+                    objects.append(obj)
+            except (ValidationError, KeyError, TypeError) as error:
+                self.on_error(number, f'{kind}: {error}')
+                continue
+            known[external_id] = obj.pk
+            mapped.append(ImportedObject(
+                source=self.source, kind=kind,
+                external_id=external_id, object_id=obj.pk))
+        dates = DATE_FIELDS.get(model, ())
+        values = [[getattr(obj, name) for name in dates] for obj in objects]
+        model.objects.bulk_create(objects, batch_size=self.batch_size)
+        if dates and objects:
+            for obj, row in zip(objects, values):
+                for name, value in zip(dates, row):
+                    setattr(obj, name, value)
+            model.objects.bulk_update(objects, dates,
+                                      batch_size=self.batch_size)
+        ImportedObject.objects.bulk_create(mapped,
+                                           batch_size=self.batch_size)
+        self.imported[kind] += len(objects)
+        return known
+
+    def references(self, kind, records, field):
+        ids = {str(record[field]) for _, record in records
+               if record.get(field) is not None}
+        return self.lookup(kind, ids)
+
+    def import_users(self, records):
+        existing = dict(User.objects.filter(username__in=[
+            record.get('username') for _, record in records
+        ]).values_list('username', 'pk'))
+
+        def make(record):
+            username = record['username']
+            if username in existing:
+                return User(pk=existing[username], username=username)
+            return User(username=username,
+                        first_name=record.get('first_name', ''),
+                        last_name=record.get('last_name', ''),
+                        password=make_password(None))
+        self.build('user', User, records, make)
+
+    def import_groups(self, records):
+        existing = dict(Group.objects.filter(slug__in=[
+            record.get('slug') for _, record in records
+        ]).values_list('slug', 'pk'))
+
+        def make(record):
+            slug = record['slug']
+            if slug in existing:
+                return Group(pk=existing[slug], slug=slug)
+            return Group(title=record['title'], slug=slug,
+                         description=record.get('description', ''))
+        self.build('group', Group, records, make)
+
+    def import_posts(self, records):
+        users = self.references('user', records, 'author')
+        groups = self.references('group', records, 'group')
+
+        def make(record):
+            group = record.get('group')
+            if group is not None and str(group) not in groups:
+                raise ValidationError(f'нет группы {group}')
+            pub_date = parse_date(record.get('pub_date'))
+            return Post(text=record['text'],
+                        author_id=self.reference(users, record['author']),
+                        group_id=groups.get(str(group)),
+                        pub_date=pub_date, updated=pub_date)
+        self.build('post', Post, records, make)
+
+    def import_comments(self, records):
+        users = self.references('user', records, 'author')
+        posts = self.references('post', records, 'post')
+
+        def make(record):
+            return Comment(text=record['text'],
+                           post_id=self.reference(posts, record['post']),
+                           author_id=self.reference(users, record['author']),
+                           created=parse_date(record.get('created')))
+        self.build('comment', Comment, records, make)
+
+    def import_follows(self, records):
+        users = self.lookup('user', {
+            str(record[field]) for _, record in records
+            for field in ('user', 'author') if field in record
+        })
+        follows = []
+        for number, record in records:
+            try:
+                user_id = self.reference(users, record['user'])
+                author_id = self.reference(users, record['author'])
+            except (ValidationError, KeyError) as error:
+                self.on_error(number, f'follow: {error}')
+                continue
+            if user_id != author_id:
+                follows.append(Follow(user_id=user_id, author_id=author_id))
+        Follow.objects.bulk_create(follows, batch_size=self.batch_size,
+                                   ignore_conflicts=True)
+        transaction.on_commit(lambda: follow_graph.forget(
+            {follow.user_id for follow in follows},
+            {follow.author_id for follow in follows},
+        ))
+        self.imported['follow'] += len(follows)
+
+    @staticmethod
+    def reference(known, external_id):
+        try:
+            return known[str(external_id)]
+        except KeyError:
+            raise ValidationError(f'нет объекта {external_id}')
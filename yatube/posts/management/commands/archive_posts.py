@@ -0,0 +1,31 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from posts.archive import archive_posts
+
+
+class Command(BaseCommand):
+    help = 'Переносит старые посты с комментариями в архивные таблицы'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            default=settings.POST_ARCHIVE_AGE_DAYS,
+                            help='Архивировать посты старше N дней')
+        parser.add_argument('--batch-size', type=int,
+                            default=settings.POST_ARCHIVE_BATCH_SIZE)
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Повторять каждые N секунд; 0 — один раз')
+
+    def handle(self, *args, **options):
+        while True:
+            before = timezone.now() - timedelta(days=options['days'])
+            moved = archive_posts(before, options['batch_size'])
+            self.stdout.write(f'Перенесено в архив: {moved}')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
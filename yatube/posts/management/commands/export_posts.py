@@ -0,0 +1,44 @@
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.export import FORMATS, export
+from posts.models import ArchivedPost, Group, Post
+
+
+class Command(BaseCommand):
+    help = 'Выгружает посты пользователя или группы с комментариями'
+
+    def add_arguments(self, parser):
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument('--user', help='Имя пользователя')
+        target.add_argument('--group', help='Слаг группы')
+        parser.add_argument('--format', choices=sorted(FORMATS),
+                            default='ndjson')
+        parser.add_argument('--output', default='-',
+                            help='Файл для выгрузки или - для stdout')
+        parser.add_argument('--gzip', action='store_true')
+        parser.add_argument('--chunk-size', type=int,
+                            default=settings.EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if options['user']:
+            lookup = {'author__username': options['user']}
+        else:
+            if not Group.objects.filter(slug=options['group']).exists():
+                raise CommandError(f'Нет группы {options["group"]}')
+            lookup = {'group__slug': options['group']}
+        posts = [ArchivedPost.objects.filter(**lookup),
+                 Post.objects.filter(**lookup)]
+        chunks = export(posts, options['format'], options['chunk_size'],
+                        options['gzip'])
+        if options['output'] == '-':
+            output = sys.stdout.buffer
+            for chunk in chunks:
+                output.write(chunk)
+            output.flush()
+            return
+        with open(options['output'], 'wb') as output:
+            for chunk in chunks:
+                output.write(chunk)
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.thumbnails import generate
+from posts.utils import batches
+
+
+class Command(BaseCommand):
+    help = 'Создаёт недостающие миниатюры для картинок постов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        with_images = Post.objects.exclude(image='')
+        generated = 0
+        for ids in batches(with_images, options['batch_size']):
+            names = Post.objects.filter(pk__in=ids).values_list(
+                'image', flat=True)
+            for name in names:
+                try:
+                    generate(name)
+                except Exception as error:
+                    self.stderr.write(f'{name}: {error}')
+                else:
+                    generated += 1
+        self.stdout.write(f'Обработано картинок: {generated}')
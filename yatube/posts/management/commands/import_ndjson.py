@@ -0,0 +1,50 @@
+import os
+import sys
+from hashlib import md5
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.importer import Importer
+
+
+def default_source(path):
+    """Имя файла и хеш абсолютного пути, размера и времени изменения:
+    одноимённые файлы из разных мест не делят контрольную точку."""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    digest = md5(f'{path}:{stat.st_size}:{stat.st_mtime_ns}'.encode())
+    return f'{os.path.basename(path)}:{digest.hexdigest()}'
+
+
+class Command(BaseCommand):
+    help = ('Загружает пользователей, группы, посты, комментарии '
+            'и подписки из NDJSON; продолжает с места падения')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл NDJSON или - для stdin')
+        parser.add_argument('--source',
+                            help='Имя импорта для контрольной точки '
+                                 'и внешних id; для stdin обязательно, '
+                                 'для файла по умолчанию строится '
+                                 'из пути, размера и времени изменения')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        source = options['source']
+        if source is None:
+            if path == '-':
+                raise CommandError('Для импорта из stdin нужен --source')
+            source = default_source(path)
+        importer = Importer(
+            source, options['batch_size'],
+            on_error=lambda line, message: self.stderr.write(
+                f'Строка {line}: {message}'),
+        )
+        if path == '-':
+            imported = importer.run(sys.stdin)
+        else:
+            with open(path, encoding='utf-8') as stream:
+                imported = importer.run(stream)
+        self.stdout.write(', '.join(
+            f'{kind}: {count}' for kind, count in imported.items()))
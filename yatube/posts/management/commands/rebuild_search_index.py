@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.search import fts_enabled, rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Переиндексирует текст постов для полнотекстового поиска'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not fts_enabled():
+            raise CommandError('Полнотекстовый поиск доступен только в SQLite')
+        indexed = rebuild_index(options['chunk_size'])
+        self.stdout.write(f'Проиндексировано постов: {indexed}')
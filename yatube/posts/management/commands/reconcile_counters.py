@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики постов, комментариев и подписок'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        fixed_users, fixed_posts = reconcile(options['batch_size'])
+        self.stdout.write(
+            f'Исправлено пользователей: {fixed_users}, '
+            f'постов: {fixed_posts}'
+        )
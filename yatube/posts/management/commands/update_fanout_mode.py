@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts.timeline import update_fanout_mode
+
+
+class Command(BaseCommand):
+    help = ('Переключает авторов между раскладкой постов по лентам '
+            'и чтением по запросу; запускается по расписанию')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            default=settings.TIMELINE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        entered, left = update_fanout_mode(options['batch_size'])
+        self.stdout.write(
+            f'Чтение по запросу: включено {entered}, выключено {left}')
@@ -0,0 +1,26 @@
+# Generated by Django 2.2.16 on 2026-10-17 04:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThumbnailSet',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image', models.CharField(max_length=255)),
+                ('preset', models.CharField(max_length=30)),
+                ('variants', models.TextField()),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='thumbnailset',
+            constraint=models.UniqueConstraint(fields=('image', 'preset'), name='unique_thumbnail_set'),
+        ),
+    ]
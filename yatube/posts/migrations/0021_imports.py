@@ -0,0 +1,36 @@
+# Generated by Django 2.2.16 on 2026-10-17 04:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0020_post_updated'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255, unique=True)),
+                ('line', models.IntegerField(default=0)),
+                ('finished', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ImportedObject',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255)),
+                ('kind', models.CharField(max_length=20)),
+                ('external_id', models.CharField(max_length=255)),
+                ('object_id', models.IntegerField()),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='importedobject',
+            constraint=models.UniqueConstraint(fields=('source', 'kind', 'external_id'), name='unique_imported_object'),
+        ),
+    ]
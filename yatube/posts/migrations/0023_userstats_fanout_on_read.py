@@ -0,0 +1,28 @@
+# Generated by Django 2.2.16 on 2026-10-17 05:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def flag_popular_authors(apps, schema_editor):
+    """Авторы, которые уже читались по запросу, остаются в этом режиме."""
+    apps.get_model('posts', 'UserStats').objects.filter(
+        followers_count__gt=settings.TIMELINE_FANOUT_LIMIT
+    ).update(fanout_on_read=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0022_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userstats',
+            name='fanout_on_read',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.RunPython(flag_popular_authors,
+                             migrations.RunPython.noop),
+    ]
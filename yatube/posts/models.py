@@ -2,6 +2,8 @@ from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import models
 
+from .storage import content_storage
+
 User = get_user_model()
 
 
@@ -19,12 +21,24 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    def feed(self):
+        """Посты для лент: автор и группа в одном запросе
+        и только нужные шаблонам поля."""
+        return self.select_related('author', 'group').only(
+            'text', 'pub_date', 'updated', 'image', 'comment_count',
+            'author', 'group', 'author__username', 'author__first_name',
+            'author__last_name', 'group__slug',
+        )
+
+
 class Post(models.Model):
     text = models.TextField(verbose_name='Текст',
                             help_text='Введите текст поста')
     pub_date = models.DateTimeField('Дата публикации',
                                     auto_now_add=True,
                                     db_index=True)
+    updated = models.DateTimeField('Дата изменения', auto_now=True)
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -43,17 +57,49 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=content_storage,
         blank=True
     )
+    comment_count = models.IntegerField(
+        'Число комментариев',
+        default=0,
+        editable=False
+    )
+
+    objects = PostQuerySet.as_manager()
+
+    archived = False
 
     class Meta:
         verbose_name = 'Post'
         verbose_name_plural = 'Posts'
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(fields=['author', 'pub_date'],
+                         name='post_author_pub_date'),
+            models.Index(fields=['group', 'pub_date'],
+                         name='post_group_pub_date'),
+        ]
 
     def __str__(self):
         return self.text[:settings.NUMBER_SYMBOL_POST]
 
+    def save(self, force_insert=False, force_update=False, using=None,
+             update_fields=None):
+        """comment_count меняется только через F() в counters,
+        поэтому правка поста его не записывает и не затирает
+        одновременные приращения."""
+        if (update_fields is None and not force_insert
+                and not self._state.adding):
+            deferred = self.get_deferred_fields()
+            update_fields = [
+                field.attname for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.attname != 'comment_count'
+                and field.attname not in deferred
+            ]
+        super().save(force_insert, force_update, using, update_fields)
+
 
 class Comment(models.Model):
     post = models.ForeignKey(
@@ -79,6 +125,86 @@ class Comment(models.Model):
     class Meta:
         verbose_name = 'Comment'
         verbose_name_plural = 'Comments'
+        indexes = [
+            models.Index(fields=['post', 'created'],
+                         name='comment_post_created'),
+        ]
+
+    def __str__(self):
+        return self.text
+
+
+class ArchivedPost(models.Model):
+    """Пост, перенесённый из горячей таблицы командой archive_posts.
+
+    id сохраняется, поэтому ссылки на пост остаются прежними.
+    Архивные посты только читаются.
+    """
+    id = models.IntegerField(primary_key=True)
+    text = models.TextField('Текст')
+    pub_date = models.DateTimeField('Дата публикации')
+    updated = models.DateTimeField('Дата изменения')
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='archived_posts',
+        verbose_name='Автор'
+    )
+    group = models.ForeignKey(
+        Group,
+        blank=True,
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name='archived_posts',
+        verbose_name='Группа'
+    )
+    image = models.ImageField(
+        'Картинка',
+        upload_to='posts/',
+        storage=content_storage,
+        blank=True
+    )
+    comment_count = models.IntegerField('Число комментариев', default=0)
+
+    objects = PostQuerySet.as_manager()
+
+    archived = True
+
+    class Meta:
+        verbose_name = 'Archived post'
+        verbose_name_plural = 'Archived posts'
+        ordering = ['-pub_date']
+        indexes = [
+            models.Index(fields=['author', 'pub_date'],
+                         name='archived_author_pub_date'),
+            models.Index(fields=['group', 'pub_date'],
+                         name='archived_group_pub_date'),
+        ]
+
+    def __str__(self):
+        return self.text[:settings.NUMBER_SYMBOL_POST]
+
+
+class ArchivedComment(models.Model):
+    id = models.IntegerField(primary_key=True)
+    post = models.ForeignKey(
+        ArchivedPost,
+        on_delete=models.CASCADE,
+        related_name='comments',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='archived_comments',
+    )
+    text = models.TextField(max_length=200)
+    created = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'created'],
+                         name='archived_comment_created'),
+        ]
 
     def __str__(self):
         return self.text
@@ -103,3 +229,99 @@ class Follow(models.Model):
                 name='unique_following'
             )
         ]
+        indexes = [
+            models.Index(fields=['user', 'author'],
+                         name='follow_user_author'),
+        ]
+
+
+class UserStats(models.Model):
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+    )
+    posts_count = models.IntegerField(default=0)
+    followers_count = models.IntegerField(default=0, db_index=True)
+    following_count = models.IntegerField(default=0)
+    # Посты автора читаются в ленте напрямую, а не раскладываются
+    # по лентам подписчиков; переключает update_fanout_mode.
+    fanout_on_read = models.BooleanField(default=False, db_index=True)
+
+    class Meta:
+        verbose_name = 'User stats'
+        verbose_name_plural = 'User stats'
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_timeline_entry'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['user', 'pub_date', 'post'],
+                         name='timeline_user_pub_date'),
+            models.Index(fields=['user', 'author'],
+                         name='timeline_user_author'),
+        ]
+
+
+class StoredImage(models.Model):
+    name = models.CharField(max_length=255, unique=True)
+    references = models.IntegerField(default=0)
+
+
+class ThumbnailSet(models.Model):
+    image = models.CharField(max_length=255)
+    preset = models.CharField(max_length=30)
+    variants = models.TextField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['image', 'preset'],
+                name='unique_thumbnail_set'
+            )
+        ]
+
+
+class ImportCheckpoint(models.Model):
+    source = models.CharField(max_length=255, unique=True)
+    line = models.IntegerField(default=0)
+    finished = models.BooleanField(default=False)
+
+
+class ImportedObject(models.Model):
+    source = models.CharField(max_length=255)
+    kind = models.CharField(max_length=20)
+    external_id = models.CharField(max_length=255)
+    object_id = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['source', 'kind', 'external_id'],
+                name='unique_imported_object'
+            )
+        ]
@@ -0,0 +1,116 @@
+from django.db import connection, transaction
+from django.db.models.expressions import RawSQL
+
+from .models import Post
+from .utils import batches, decode_cursor, encode_cursor
+
+SEARCH_TABLE = 'posts_post_fts'
+
+
+def fts_enabled():
+    return connection.vendor == 'sqlite'
+
+
+def match_expression(query):
+    """Превращает ввод пользователя в запрос FTS5 из слов в кавычках,
+    чтобы операторы и скобки не ломали синтаксис MATCH."""
+    return ' '.join(
+        '"{}"'.format(term.replace('"', '""')) for term in query.split()
+    )
+
+
+def index_post(post):
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s',
+                       [post.pk])
+        cursor.execute(
+            f'INSERT INTO {SEARCH_TABLE}(rowid, text) VALUES (%s, %s)',
+            [post.pk, post.text]
+        )
+
+
+def unindex_post(post_id):
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s',
+                       [post_id])
+
+
+def unindex_posts(post_ids):
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s',
+                           [[post_id] for post_id in post_ids])
+
+
+def matching_posts(queryset, query):
+    """Фильтрует queryset постов по полнотекстовому запросу."""
+    if not fts_enabled():
+        return queryset.filter(text__icontains=query)
+    return queryset.filter(pk__in=RawSQL(
+        f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s',
+        [match_expression(query)]
+    ))
+
+
+def search_posts(query, after, limit):
+    """Возвращает страницу постов по релевантности и курсор следующей.
+
+    Страницы переключаются по ключу (rank, rowid), поэтому глубина
+    выдачи не влияет на стоимость запроса.
+    """
+    expression = match_expression(query)
+    if not expression or not fts_enabled():
+        return [], None
+    sql = (f'SELECT rowid, rank FROM {SEARCH_TABLE} '
+           f'WHERE {SEARCH_TABLE} MATCH %s')
+    params = [expression]
+    position = decode_cursor(after)
+    try:
+        rank, rowid = float(position[0]), int(position[1])
+    except (TypeError, ValueError, IndexError):
+        pass
+    else:
+        sql += ' AND (rank > %s OR (rank = %s AND rowid > %s))'
+        params += [rank, rank, rowid]
+    sql += ' ORDER BY rank, rowid LIMIT %s'
+    params.append(limit + 1)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(*reversed(rows[-1]))
+    posts = Post.objects.feed().in_bulk([rowid for rowid, _ in rows])
+    return [posts[rowid] for rowid, _ in rows if rowid in posts], next_cursor
+
+
+def rebuild_index(chunk_size):
+    """Переиндексирует посты пачками по pk, каждую в своей транзакции,
+    и удаляет записи индекса для исчезнувших постов."""
+    indexed = 0
+    for ids in batches(Post.objects.all(), chunk_size):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {SEARCH_TABLE} '
+                f'WHERE rowid >= %s AND rowid <= %s',
+                [ids[0], ids[-1]]
+            )
+            cursor.execute(
+                f'INSERT INTO {SEARCH_TABLE}(rowid, text) '
+                f'SELECT id, text FROM posts_post '
+                f'WHERE id >= %s AND id <= %s',
+                [ids[0], ids[-1]]
+            )
+        indexed += len(ids)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {SEARCH_TABLE} '
+            f'WHERE rowid NOT IN (SELECT id FROM posts_post)'
+        )
+    return indexed
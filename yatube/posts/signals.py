@@ -0,0 +1,133 @@
+from django.db import transaction
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+
+from . import counters, images, search, timeline
+from .follow_graph import follow_graph
+from .models import ArchivedPost, Comment, Follow, Group, Post
+from .utils import FEED_VERSION_KEY, POST_COUNT_VERSION_KEY, bump_version
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Follow)
+def invalidate_counts_on_create(sender, created, **kwargs):
+    if created:
+        bump_version(POST_COUNT_VERSION_KEY)
+
+
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=ArchivedPost)
+@receiver(post_delete, sender=Follow)
+def invalidate_counts_on_delete(sender, **kwargs):
+    bump_version(POST_COUNT_VERSION_KEY)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Comment)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=ArchivedPost)
+@receiver(post_delete, sender=Comment)
+@receiver(post_delete, sender=Group)
+def invalidate_feeds(sender, **kwargs):
+    bump_version(FEED_VERSION_KEY)
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, **kwargs):
+    if created:
+        timeline.fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, **kwargs):
+    if created:
+        timeline.backfill(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def prune_timeline(sender, instance, **kwargs):
+    timeline.prune(instance)
+
+
+@receiver(post_save, sender=Post)
+def count_post(sender, instance, created, **kwargs):
+    if created:
+        counters.change_user_stats(instance.author_id, posts_count=1)
+
+
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=ArchivedPost)
+def uncount_post(sender, instance, **kwargs):
+    counters.change_user_stats(instance.author_id, posts_count=-1)
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created, **kwargs):
+    if created:
+        counters.change_comment_count(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_comment(sender, instance, **kwargs):
+    counters.change_comment_count(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_follow(sender, instance, created, **kwargs):
+    if created:
+        counters.change_user_stats(instance.author_id, followers_count=1)
+        counters.change_user_stats(instance.user_id, following_count=1)
+
+
+@receiver(post_delete, sender=Follow)
+def uncount_follow(sender, instance, **kwargs):
+    counters.change_user_stats(instance.author_id, followers_count=-1)
+    counters.change_user_stats(instance.user_id, following_count=-1)
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, **kwargs):
+    search.index_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    search.unindex_post(instance.pk)
+
+
+@receiver(post_init, sender=Post)
+def remember_image(sender, instance, **kwargs):
+    image = instance.__dict__.get('image')
+    instance._original_image = getattr(image, 'name', image) or ''
+
+
+@receiver(post_save, sender=Post)
+def reference_image(sender, instance, **kwargs):
+    if 'image' not in instance.__dict__:
+        return
+    name = instance.image.name or ''
+    if name != instance._original_image:
+        images.acquire(name)
+        images.release(instance._original_image)
+        instance._original_image = name
+
+
+@receiver(pre_delete, sender=Post)
+@receiver(pre_delete, sender=ArchivedPost)
+def dereference_image(sender, instance, **kwargs):
+    images.release(instance.image.name)
+
+
+@receiver(post_save, sender=Follow)
+def add_to_follow_graph(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: follow_graph.add(
+            instance.user_id, instance.author_id))
+
+
+@receiver(post_delete, sender=Follow)
+def remove_from_follow_graph(sender, instance, **kwargs):
+    transaction.on_commit(lambda: follow_graph.remove(
+        instance.user_id, instance.author_id))
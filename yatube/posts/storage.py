@@ -0,0 +1,53 @@
+import os
+import tempfile
+from hashlib import sha256
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, в котором имя файла — хеш его содержимого.
+
+    Файл хешируется кусками во время записи во временный файл;
+    одинаковые загрузки попадают в один и тот же файл вида
+    posts/ab/abcdef….jpg, и повторная запись не создаёт копию.
+    Сколько постов ссылается на файл, учитывает модель StoredImage.
+    Если файл уже есть, запись пропускается; файл, который
+    images.collect удалил до взятия ссылки, возвращает
+    images.restore.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        directory, basename = os.path.split(name)
+        extension = os.path.splitext(basename)[1].lower()
+        full_directory = self.path(directory)
+        os.makedirs(full_directory, exist_ok=True)
+        digest = sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        with tempfile.NamedTemporaryFile(dir=full_directory,
+                                         suffix='.upload',
+                                         delete=False) as temporary:
+            for chunk in content.chunks():
+                digest.update(chunk)
+                temporary.write(chunk)
+        key = digest.hexdigest()
+        name = os.path.join(directory, key[:2], f'{key}{extension}')
+        full_path = self.path(name)
+        if os.path.exists(full_path):
+            os.remove(temporary.name)
+            return name
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        file_move_safe(temporary.name, full_path, allow_overwrite=True)
+        if self.file_permissions_mode is not None:
+            os.chmod(full_path, self.file_permissions_mode)
+        return name.replace('\\', '/')
+
+
+content_storage = ContentAddressedStorage()
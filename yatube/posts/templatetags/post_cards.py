@@ -0,0 +1,59 @@
+from hashlib import md5
+
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from ..thumbnails import resolve
+
+register = template.Library()
+
+CARD_TEMPLATE = 'posts/includes/card.html'
+
+
+def _card_key(post, show_author, pictures):
+    """Ключ карточки меняется вместе с постом.
+
+    updated обновляется при сохранении через форму и админку,
+    число комментариев меняется отдельным UPDATE, а готовность
+    миниатюр переключает заглушку на <picture>. Имя автора
+    и слаг группы меняются без сохранения поста (удаление группы
+    обнуляет group_id через UPDATE), поэтому их хеш тоже в ключе.
+    """
+    ready = int(bool(post.image) and post.image.name in pictures)
+    shown = [post.group.slug if post.group_id else '']
+    if show_author:
+        shown += [post.author.username, post.author.get_full_name()]
+    names = md5('\n'.join(shown).encode()).hexdigest()
+    return (f'posts:card:{int(show_author)}:{post.pk}:'
+            f'{post.updated.timestamp()}:{post.comment_count}:{ready}:'
+            f'{names}')
+
+
+@register.simple_tag
+def post_cards(posts, show_author=True, preset_name='feed'):
+    """HTML карточек постов страницы из кэша фрагментов.
+
+    Готовые карточки достаются одним get_many, рендерятся
+    только промахи, и они же разом записываются в кэш.
+    """
+    posts = list(posts)
+    names = [post.image.name for post in posts if post.image]
+    pictures = resolve(names, preset_name) if names else {}
+    keys = [_card_key(post, show_author, pictures) for post in posts]
+    cards = cache.get_many(keys)
+    rendered = {}
+    for key, post in zip(keys, posts):
+        if key not in cards:
+            rendered[key] = render_to_string(CARD_TEMPLATE, {
+                'post': post,
+                'show_author': show_author,
+                'pictures': pictures,
+                'preset_name': preset_name,
+            })
+    if rendered:
+        cache.set_many(rendered, settings.CARD_CACHE_TIMEOUT)
+        cards.update(rendered)
+    return [mark_safe(cards[key]) for key in keys]
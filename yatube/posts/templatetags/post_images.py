@@ -0,0 +1,35 @@
+from django import template
+from sorl.thumbnail import default
+
+from ..thumbnails import THUMBNAIL_PRESETS, resolve
+
+register = template.Library()
+
+
+@register.inclusion_tag('posts/includes/picture.html')
+def picture(image, preset_name='feed', resolved=None):
+    """Разметка <picture> с готовыми миниатюрами набора.
+
+    Миниатюры берутся из resolved, собранного тегом карточек для
+    всей страницы, либо ищутся для одной картинки. Пока фоновая
+    задача их не создала, выводится заглушка с пропорциями кадра.
+    """
+    preset = THUMBNAIL_PRESETS[preset_name]
+    if image and resolved is None:
+        resolved = resolve([image.name], preset_name)
+    srcsets = {}
+    if image:
+        for image_format, width, name, *_ in resolved.get(image.name, ()):
+            srcsets.setdefault(image_format, []).append(
+                (default.storage.url(name), width))
+    fallback = srcsets.pop(preset['formats'][-1], None)
+    return {
+        'image': image,
+        'size': preset['size'],
+        'sizes': preset['sizes'],
+        'sources': [
+            (f'image/{image_format.lower()}', srcset)
+            for image_format, srcset in srcsets.items()
+        ],
+        'fallback': fallback,
+    }
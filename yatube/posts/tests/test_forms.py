@@ -1,16 +1,33 @@
 import shutil
 import tempfile
+from contextlib import contextmanager
+from hashlib import sha256
+from io import BytesIO
+from unittest import mock
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
 
-from ..models import Comment, Group, Post
+from .. import views
+from ..images import collect
+from ..models import Comment, Group, Post, StoredImage
 
 User = get_user_model()
 
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+SMALL_GIF_HASH = sha256(SMALL_GIF).hexdigest()
+
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
@@ -46,17 +63,9 @@ class PostCreateFormTests(TestCase):
 
     def test_create_post(self):
         post_count = Post.objects.count()
-        small_gif = (
-            b'\x47\x49\x46\x38\x39\x61\x02\x00'
-            b'\x01\x00\x80\x00\x00\x00\x00\x00'
-            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
-            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
-            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
-            b'\x0A\x00\x3B'
-        )
         uploaded = SimpleUploadedFile(
             name='small.gif',
-            content=small_gif,
+            content=SMALL_GIF,
             content_type='image/gif'
         )
         form_data = {
@@ -78,10 +87,164 @@ class PostCreateFormTests(TestCase):
                 text=form_data['text'],
                 group=self.group.pk,
                 author=self.user,
-                image=f'posts/{uploaded.name}'
+                image=f'posts/{SMALL_GIF_HASH[:2]}/{SMALL_GIF_HASH}.gif'
             ).exists()
         )
 
+    @override_settings(IMAGE_MAX_SIZE=(200, 200))
+    def test_large_image_downscaled(self):
+        """Большой JPEG уменьшается и поворачивается по EXIF."""
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        buffer = BytesIO()
+        Image.new('RGB', (1200, 600), 'red').save(
+            buffer, 'JPEG', exif=exif.tobytes())
+        self.authorized_client_author.post(
+            reverse('posts:post_create'),
+            data={
+                'text': 'Большая картинка',
+                'image': SimpleUploadedFile(
+                    name='big.jpeg', content=buffer.getvalue(),
+                    content_type='image/jpeg'),
+            },
+        )
+        post = Post.objects.get(text='Большая картинка')
+        self.assertTrue(post.image.name.endswith('.jpg'))
+        with Image.open(post.image) as stored:
+            self.assertEqual(stored.size, (100, 200))
+            self.assertNotIn(0x0112, stored.getexif())
+
+    @override_settings(IMAGE_MAX_SIZE=(200, 200))
+    def test_large_static_gif_downscaled_and_icc_kept(self):
+        """Статичный GIF уменьшается, ICC-профиль JPEG сохраняется."""
+        # Pillow переносит профиль байтами, не разбирая его.
+        profile = b'icc-profile-bytes'
+        gif, jpeg = BytesIO(), BytesIO()
+        Image.new('P', (800, 400)).save(gif, 'GIF')
+        Image.new('RGB', (800, 400), 'red').save(jpeg, 'JPEG',
+                                                 icc_profile=profile)
+        uploads = (('big.gif', gif, 'image/gif'),
+                   ('icc.jpeg', jpeg, 'image/jpeg'))
+        for name, content, content_type in uploads:
+            self.authorized_client_author.post(
+                reverse('posts:post_create'),
+                data={
+                    'text': name,
+                    'image': SimpleUploadedFile(
+                        name=name, content=content.getvalue(),
+                        content_type=content_type),
+                },
+            )
+        post = Post.objects.get(text='big.gif')
+        self.assertTrue(post.image.name.endswith('.png'))
+        with Image.open(post.image) as stored:
+            self.assertEqual(stored.size, (200, 100))
+        with Image.open(Post.objects.get(text='icc.jpeg').image) as stored:
+            self.assertEqual(stored.info.get('icc_profile'), profile)
+
+    @override_settings(IMAGE_MAX_PIXELS=100)
+    def test_too_many_pixels_rejected(self):
+        """Картинка с огромным числом пикселей не принимается."""
+        buffer = BytesIO()
+        Image.new('RGB', (20, 20)).save(buffer, 'PNG')
+        response = self.authorized_client_author.post(
+            reverse('posts:post_create'),
+            data={
+                'text': 'Бомба',
+                'image': SimpleUploadedFile(
+                    name='bomb.png', content=buffer.getvalue(),
+                    content_type='image/png'),
+            },
+        )
+        self.assertFormError(
+            response, 'form', 'image',
+            'Картинка слишком большая: 20×20 пикселей.')
+        self.assertFalse(Post.objects.filter(text='Бомба').exists())
+
+    def test_same_image_stored_once(self):
+        """Одинаковые картинки хранятся одним файлом со счётчиком ссылок."""
+        for name in ('first.gif', 'second.gif'):
+            self.authorized_client_author.post(
+                reverse('posts:post_create'),
+                data={
+                    'text': name,
+                    'image': SimpleUploadedFile(
+                        name=name, content=SMALL_GIF,
+                        content_type='image/gif'),
+                },
+            )
+        first, second = Post.objects.filter(
+            text__in=('first.gif', 'second.gif'))
+        self.assertEqual(first.image.name, second.image.name)
+        stored = StoredImage.objects.get(name=first.image.name)
+        self.assertEqual(stored.references, 2)
+        first.delete()
+        stored.refresh_from_db()
+        self.assertEqual(stored.references, 1)
+        second.delete()
+        collect(second.image.name)
+        self.assertFalse(
+            StoredImage.objects.filter(name=second.image.name).exists())
+        self.assertFalse(second.image.storage.exists(second.image.name))
+
+    def test_image_stored_before_write_transaction(self):
+        """Файл картинки пишется до BEGIN IMMEDIATE, а не внутри него."""
+        content = SMALL_GIF.replace(b'\xFF\xFF\xFF', b'\xFE\xFF\xFF', 1)
+        digest = sha256(content).hexdigest()
+        name = f'posts/{digest[:2]}/{digest}.gif'
+        self.assertFalse(Post.image.field.storage.exists(name))
+        seen = []
+        immediate_atomic = views.immediate_atomic
+
+        @contextmanager
+        def spy():
+            seen.append(Post.image.field.storage.exists(name))
+            with immediate_atomic():
+                yield
+
+        with mock.patch('posts.views.immediate_atomic', spy):
+            self.authorized_client_author.post(
+                reverse('posts:post_create'),
+                data={
+                    'text': 'Пост с картинкой',
+                    'image': SimpleUploadedFile(
+                        name='small.gif', content=content,
+                        content_type='image/gif'),
+                },
+            )
+        self.assertEqual(seen, [True])
+        self.assertEqual(Post.objects.get(text='Пост с картинкой').image.name,
+                         name)
+
+    def test_file_collected_before_reference_is_restored(self):
+        """Файл, удалённый collect до взятия ссылки, записывается снова."""
+        content = SMALL_GIF.replace(b'\xFF\xFF\xFF', b'\xFD\xFF\xFF', 1)
+        digest = sha256(content).hexdigest()
+        name = f'posts/{digest[:2]}/{digest}.gif'
+        storage = Post.image.field.storage
+        storage.save(name, SimpleUploadedFile('old.gif', content))
+        immediate_atomic = views.immediate_atomic
+
+        @contextmanager
+        def collect_first():
+            storage.delete(name)
+            with immediate_atomic():
+                yield
+
+        with mock.patch('posts.views.immediate_atomic', collect_first):
+            self.authorized_client_author.post(
+                reverse('posts:post_create'),
+                data={
+                    'text': 'Гонка с collect',
+                    'image': SimpleUploadedFile(
+                        name='small.gif', content=content,
+                        content_type='image/gif'),
+                },
+            )
+        self.assertEqual(Post.objects.get(text='Гонка с collect').image.name,
+                         name)
+        self.assertTrue(storage.exists(name))
+
     def test_edit_post(self):
         post_count = Post.objects.count()
         form_data = {
@@ -108,7 +271,8 @@ class PostCreateFormTests(TestCase):
         )
         path = reverse(
             'posts:post_detail', args=(self.post.pk,))
-        self.assertRedirects(response, path)
+        comment = Comment.objects.latest('pk')
+        self.assertRedirects(response, f'{path}#comment-{comment.pk}')
         self.assertEqual(Comment.objects.count(), comment_count + 1)
         self.assertTrue(
             Comment.objects.filter(
@@ -1,8 +1,21 @@
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
 
-from ..models import Group, Post
+from ..follow_graph import follow_graph
+from ..importer import Importer
+from ..management.commands.import_ndjson import default_source
+from ..models import (Comment, Follow, Group, ImportCheckpoint, Post,
+                      TimelineEntry, UserStats)
 
 User = get_user_model()
 
@@ -57,3 +70,174 @@ class PostModelTest(TestCase):
             with self.subTest(field=field):
                 self.assertEqual(
                     task._meta.get_field(field).help_text, expected_value)
+
+
+class CountersTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='Автор')
+        self.reader = User.objects.create_user(username='Читатель')
+        self.post = Post.objects.create(author=self.author, text='Пост')
+
+    def stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_counters_follow_create_and_delete(self):
+        """Счётчики меняются при создании и удалении объектов."""
+        comment = Comment.objects.create(post=self.post, author=self.reader,
+                                         text='Комментарий')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+        comment.delete()
+        follow.delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 0)
+        self.assertEqual(self.stats(self.author).followers_count, 0)
+        self.assertEqual(self.stats(self.reader).following_count, 0)
+
+    def test_edit_keeps_concurrent_comment_count(self):
+        """Сохранение поста не затирает приращение счётчика."""
+        post = Post.objects.get(pk=self.post.pk)
+        Comment.objects.create(post=self.post, author=self.reader,
+                               text='Комментарий')
+        post.text = 'Правка'
+        post.save()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.text, 'Правка')
+        self.assertEqual(self.post.comment_count, 1)
+
+    def test_reconcile_counters_fixes_drift(self):
+        """Команда reconcile_counters исправляет расхождения."""
+        UserStats.objects.filter(user=self.author).update(posts_count=7)
+        Post.objects.filter(pk=self.post.pk).update(comment_count=3)
+        out = StringIO()
+        call_command('reconcile_counters', batch_size=1, stdout=out)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 0)
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertTrue(self.stats(self.reader))
+        self.assertIn('постов: 1', out.getvalue())
+
+
+class FollowGraphTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        follow_graph.clear()
+        self.reader, self.other, *self.authors = [
+            User.objects.create_user(username=f'user{i}') for i in range(5)
+        ]
+
+    def test_graph_follows_signals(self):
+        """Подписки и отписки сразу видны в загруженном графе."""
+        first, second, third = self.authors
+        Follow.objects.create(user=self.reader, author=second)
+        self.assertEqual(list(follow_graph.following(self.reader.pk)),
+                         [second.pk])
+        Follow.objects.create(user=self.reader, author=first)
+        Follow.objects.create(user=self.other, author=first)
+        with self.assertNumQueries(0):
+            self.assertEqual(list(follow_graph.following(self.reader.pk)),
+                             [first.pk, second.pk])
+            self.assertTrue(
+                follow_graph.is_following(self.reader.pk, first.pk))
+            self.assertFalse(
+                follow_graph.is_following(self.reader.pk, third.pk))
+        Follow.objects.filter(user=self.reader, author=second).delete()
+        self.assertEqual(follow_graph.followed_among(
+            self.reader.pk, [first.pk, second.pk, third.pk]), {first.pk})
+        self.assertEqual(
+            follow_graph.common_following(self.reader.pk, self.other.pk),
+            [first.pk])
+        self.assertEqual(list(follow_graph.followers(first.pk)),
+                         sorted([self.reader.pk, self.other.pk]))
+
+    def test_rolled_back_follow_not_in_graph(self):
+        """Подписка попадает в граф только после коммита."""
+        follow_graph.following(self.reader.pk)
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                Follow.objects.create(user=self.reader, author=self.authors[0])
+                raise RuntimeError
+        self.assertFalse(
+            follow_graph.is_following(self.reader.pk, self.authors[0].pk))
+
+    def test_cache_clear_reloads_graph(self):
+        """После очистки кэша граф перечитывается из базы."""
+        follow_graph.following(self.reader.pk)
+        Follow.objects.bulk_create(
+            [Follow(user=self.reader, author=self.authors[0])])
+        cache.clear()
+        self.assertTrue(
+            follow_graph.is_following(self.reader.pk, self.authors[0].pk))
+
+
+IMPORT_LINES = [
+    '{"type": "user", "id": 1, "username": "alice", "first_name": "Алиса"}',
+    '{"type": "user", "id": 2, "username": "bob"}',
+    '{"type": "group", "id": "g", "title": "Группа", "slug": "imported",'
+    ' "description": "Описание"}',
+    '{"type": "post", "id": 10, "author": 1, "group": "g", "text": "Пост",'
+    ' "pub_date": "2020-01-02T03:04:05"}',
+    '{"type": "comment", "id": 100, "post": 10, "author": 2,'
+    ' "text": "Комментарий"}',
+    '{"type": "follow", "user": 2, "author": 1}',
+    '{"type": "post", "id": 11, "author": 99, "text": "Без автора"}',
+    'не json',
+]
+
+
+class ImportNdjsonTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        handle, self.path = tempfile.mkstemp(suffix='.ndjson')
+        with os.fdopen(handle, 'w', encoding='utf-8') as stream:
+            stream.write('\n'.join(IMPORT_LINES) + '\n')
+        self.addCleanup(os.remove, self.path)
+
+    def check_imported(self):
+        alice = User.objects.get(username='alice')
+        post = Post.objects.get(text='Пост')
+        self.assertEqual(post.author, alice)
+        self.assertEqual(post.group.slug, 'imported')
+        self.assertEqual(post.pub_date.year, 2020)
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(alice.stats.followers_count, 1)
+        self.assertTrue(TimelineEntry.objects.filter(
+            user__username='bob', post=post).exists())
+        self.assertEqual(Post.objects.count(), 1)
+        self.assertEqual(Comment.objects.count(), 1)
+
+    def test_import_and_rebuild(self):
+        """Импорт пишет строки пачками и пересобирает производные данные."""
+        self.assertNotContains(self.client.get(reverse('posts:index')),
+                               'Пост')
+        errors = StringIO()
+        call_command('import_ndjson', self.path, '--batch-size', '3',
+                     stdout=StringIO(), stderr=errors)
+        self.check_imported()
+        self.assertIn('Строка 7', errors.getvalue())
+        self.assertIn('Строка 8', errors.getvalue())
+        self.assertContains(self.client.get(reverse('posts:index')), 'Пост')
+
+    def test_stdin_requires_source(self):
+        """Без --source импорт из stdin не запускается."""
+        with self.assertRaises(CommandError):
+            call_command('import_ndjson', '-', stdout=StringIO())
+
+    def test_resume_after_crash(self):
+        """После падения импорт продолжается с контрольной точки."""
+        with mock.patch.object(Importer, 'import_follows',
+                               side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                call_command('import_ndjson', self.path, '--batch-size', '3',
+                             stdout=StringIO(), stderr=StringIO())
+        checkpoint = ImportCheckpoint.objects.get(
+            source=default_source(self.path))
+        self.assertEqual(checkpoint.line, 3)
+        self.assertFalse(checkpoint.finished)
+        call_command('import_ndjson', self.path, '--batch-size', '3',
+                     stdout=StringIO(), stderr=StringIO())
+        self.check_imported()
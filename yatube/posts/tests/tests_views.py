@@ -1,15 +1,30 @@
+import csv
+import gzip
+import json
 import shutil
 import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
 from django import forms
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
 from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 
-from ..models import Follow, Group, Post
+from ..archive import archive_boundary, archive_posts
+from ..models import (ArchivedComment, ArchivedPost, Comment, Follow, Group,
+                      Post, ThumbnailSet, TimelineEntry, UserStats)
+from ..templatetags.post_cards import _card_key
+from ..thumbnails import generate, supported_formats
 
 User = get_user_model()
 
@@ -122,6 +137,50 @@ class PostPagesTest(TestCase):
         first_object = response.context['post']
         self.assertEqual(first_object.image, self.post.image)
 
+    def test_thumbnail_placeholder_until_generated(self):
+        """До фоновой генерации миниатюры выводится заглушка."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        response = self.client.get(url)
+        self.assertContains(response, 'aspect-ratio')
+        self.assertNotContains(response, 'class="card-img my-2" src=')
+        generate(self.post.image.name)
+        response = self.client.get(url)
+        self.assertContains(response, 'class="card-img my-2" src="/media/')
+        self.assertContains(response, ' 320w, ',
+                            count=len(supported_formats('feed')))
+
+    def test_generated_thumbnails_refresh_pages(self):
+        """Готовые миниатюры сбрасывают кэш лент и меняют ETag."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        )
+        etags = {url: self.client.get(url)['ETag'] for url in urls}
+        generate(self.post.image.name)
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url,
+                                           HTTP_IF_NONE_MATCH=etags[url])
+                self.assertEqual(response.status_code, 200)
+                self.assertContains(response, '<picture>')
+
+    def test_feed_thumbnails_resolved_in_one_query(self):
+        """Миниатюры всех постов страницы находятся одним запросом."""
+        for i in range(3):
+            post = Post.objects.create(author=self.user, text=f'Пост {i}',
+                                       image=self.post.image.name)
+            generate(post.image.name)
+        generate(self.post.image.name)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('posts:index'))
+        thumbnail_queries = [query for query in queries
+                             if 'posts_thumbnailset' in query['sql']]
+        self.assertEqual(len(thumbnail_queries), 1)
+        self.assertContains(response, '<picture>', count=4)
+        self.assertTrue(ThumbnailSet.objects.filter(
+            image=self.post.image.name, preset='feed').exists())
+
     def test_create_post_page_show_correct_context(self):
         response = self.authorized_client_author.get(
             reverse('posts:post_create'))
@@ -228,17 +287,24 @@ class PostPagesTest(TestCase):
         self.assertEqual(Follow.objects.count(), follow_count)
 
     def test_cache_if_post_delete(self):
-        """При удалении поста содержимое не меняется.
-        При очистке кэша содержимое изменяется."""
-        post = Post.objects.get(pk=self.post.pk)
-        response = self.authorized_client.get(reverse('posts:index'))
-        post.delete()
-        response_before = self.authorized_client.get(reverse('posts:index'))
-        self.assertEqual(response.content, response_before.content)
-        cache.clear()
-        response_after = self.authorized_client.get(reverse('posts:index'))
+        """Лента отдаётся из кэша без запросов к базе,
+        удаление поста сразу сбрасывает кэш."""
+        response = self.client.get(reverse('posts:index'))
+        with self.assertNumQueries(0):
+            response_cached = self.client.get(reverse('posts:index'))
+        self.assertEqual(response.content, response_cached.content)
+        Post.objects.get(pk=self.post.pk).delete()
+        response_after = self.client.get(reverse('posts:index'))
         self.assertNotEqual(response.content, response_after.content)
 
+    def test_cached_feed_keeps_personal_header(self):
+        """Шапка страницы из кэша показывает текущего пользователя."""
+        self.authorized_client_author.get(reverse('posts:index'))
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertNotIn('page_obj', response.context)
+        self.assertContains(response, self.user_follower.username)
+        self.assertNotContains(response, f'Пользователь: {self.user}')
+
 
 class PaginatorViewsTest(TestCase):
     NUM_CREATE_POSTS = 13
@@ -284,3 +350,566 @@ class PaginatorViewsTest(TestCase):
                 self.assertEqual(
                     len(response.context['page_obj']), remaining_pages,
                     f'На странице {reverse_name} ошибка пагинатора')
+
+    def test_cursor_pages(self):
+        """Курсор ведёт на следующую страницу и обратно без номера"""
+        for reverse_name, kwargs in self.pages.items():
+            with self.subTest(reverse_name=reverse_name, kwargs=kwargs):
+                url = reverse(reverse_name, kwargs=kwargs)
+                first_page = self.client.get(url).context['page_obj']
+                self.assertFalse(first_page.has_previous())
+                self.assertTrue(first_page.has_next())
+                cache.clear()
+                second_page = self.client.get(
+                    f'{url}?after={first_page.paginator.next_cursor}'
+                ).context['page_obj']
+                self.assertEqual(
+                    len(second_page),
+                    self.NUM_CREATE_POSTS - settings.POST_ON_PAGE)
+                self.assertFalse(second_page.has_next())
+                cache.clear()
+                previous_page = self.client.get(
+                    f'{url}?before={second_page.paginator.previous_cursor}'
+                ).context['page_obj']
+                self.assertEqual(list(previous_page), list(first_page))
+
+    @override_settings(POST_ON_PAGE=1, PAGE_WINDOW=2)
+    def test_page_links_window(self):
+        """Пагинатор выводит только окно соседних страниц"""
+        url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        response = self.client.get(f'{url}?page=7')
+        self.assertEqual(
+            list(response.context['page_obj'].paginator.page_window),
+            [5, 6, 7, 8, 9])
+        self.assertNotContains(response, '?page=4"')
+
+    def test_page_count_is_cached(self):
+        """Число постов берётся из кэша и сбрасывается новым постом"""
+        url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        self.client.get(f'{url}?page=2')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(f'{url}?page=2')
+        self.assertFalse(
+            [query for query in queries
+             if query['sql'].startswith('SELECT COUNT(')])
+        Post.objects.create(text='Новый пост', group=self.group,
+                            author=self.user)
+        response = self.client.get(f'{url}?page=2')
+        self.assertEqual(response.context['page_obj'].paginator.count,
+                         self.NUM_CREATE_POSTS + 1)
+
+
+class TimelineTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='Автор')
+        self.reader = User.objects.create_user(username='Читатель')
+        self.client.force_login(self.reader)
+        self.old_post = Post.objects.create(text='Старый пост',
+                                            author=self.author)
+
+    def follow(self):
+        self.client.get(reverse('posts:profile_follow',
+                                kwargs={'username': self.author}))
+
+    def test_timeline_filled_on_follow_and_post(self):
+        """Лента заполняется при подписке и публикации,
+        очищается при отписке."""
+        self.follow()
+        new_post = Post.objects.create(text='Новый пост', author=self.author)
+        self.assertEqual(
+            set(self.reader.timeline.values_list('post', flat=True)),
+            {self.old_post.pk, new_post.pk})
+        response = self.client.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']),
+                         [new_post, self.old_post])
+        self.client.get(reverse('posts:profile_unfollow',
+                                kwargs={'username': self.author}))
+        self.assertFalse(self.reader.timeline.exists())
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_popular_author_read_on_demand(self):
+        """Посты популярного автора не раскладываются по лентам,
+        но видны в ленте подписок."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        call_command('update_fanout_mode', stdout=StringIO())
+        new_post = Post.objects.create(text='Новый пост', author=self.author)
+        self.assertFalse(
+            TimelineEntry.objects.filter(post=new_post).exists())
+        response = self.client.get(reverse('posts:follow_index'))
+        self.assertIn(new_post, response.context['page_obj'])
+
+    def test_author_leaving_popular_set_is_backfilled(self):
+        """Посты, написанные в режиме чтения по запросу, попадают
+        в ленты командой, когда автор перестаёт быть популярным."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        with self.settings(TIMELINE_FANOUT_LIMIT=0):
+            call_command('update_fanout_mode', stdout=StringIO())
+        new_post = Post.objects.create(text='Новый пост', author=self.author)
+        self.assertFalse(
+            TimelineEntry.objects.filter(post=new_post).exists())
+        cache.clear()
+        response = self.client.get(reverse('posts:follow_index'))
+        self.assertIn(new_post, response.context['page_obj'])
+        out = StringIO()
+        call_command('update_fanout_mode', stdout=out)
+        self.assertIn('выключено 1', out.getvalue())
+        self.assertFalse(
+            UserStats.objects.get(user=self.author).fanout_on_read)
+        response = self.client.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']),
+                         [new_post, self.old_post])
+        self.assertTrue(
+            TimelineEntry.objects.filter(post=new_post).exists())
+
+
+class FeedQueryBudgetTest(TestCase):
+    """Число запросов ленты не зависит от числа постов на странице."""
+    QUERY_BUDGET = {
+        'posts:index': 3,
+        'posts:group_list': 4,
+        'posts:profile': 6,
+        'posts:follow_index': 4,
+    }
+
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user(username='Читатель')
+        self.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        self.client.force_login(self.reader)
+
+    def create_posts(self, count):
+        for i in range(count):
+            author = User.objects.create_user(username=f'Автор{i}')
+            Follow.objects.create(user=self.reader, author=author)
+            post = Post.objects.create(text=f'Пост {i}', author=author,
+                                       group=self.group)
+            post.comments.create(author=self.reader, text='Комментарий')
+        return author
+
+    def check_budget(self, author):
+        kwargs = {
+            'posts:index': None,
+            'posts:group_list': {'slug': self.group.slug},
+            'posts:profile': {'username': author.username},
+            'posts:follow_index': None,
+        }
+        for reverse_name, budget in self.QUERY_BUDGET.items():
+            with self.subTest(reverse_name=reverse_name):
+                cache.clear()
+                # Граница архива хранится в кэше без срока.
+                archive_boundary()
+                url = reverse(reverse_name, kwargs=kwargs[reverse_name])
+                with self.assertNumQueries(budget):
+                    self.client.get(url)
+                cache.clear()
+                archive_boundary()
+                with self.assertNumQueries(budget + 1):
+                    self.client.get(f'{url}?page=1')
+
+    def test_feed_query_budget_one_post(self):
+        self.check_budget(self.create_posts(1))
+
+    def test_feed_query_budget_full_pages(self):
+        self.check_budget(self.create_posts(settings.POST_ON_PAGE * 2))
+
+
+@override_settings(POST_ON_PAGE=2)
+class SearchViewTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='Автор')
+        self.posts = [
+            Post.objects.create(author=self.user, text=text)
+            for text in ('Кот и пёс', 'Кот кот кот', 'Только пёс',
+                         'Кот (и) "мышь"')
+        ]
+
+    def test_search_ranked_with_cursor(self):
+        """Поиск возвращает совпадения по релевантности
+        и листается курсором."""
+        url = reverse('posts:search')
+        response = self.client.get(url, {'q': 'кот'})
+        first_page = response.context['posts']
+        self.assertEqual(first_page[0], self.posts[1])
+        response = self.client.get(
+            url, {'q': 'кот', 'after': response.context['next_cursor']})
+        found = first_page + response.context['posts']
+        self.assertEqual(
+            set(found), {self.posts[0], self.posts[1], self.posts[3]})
+        self.assertIsNone(response.context['next_cursor'])
+
+    def test_search_follows_edit_and_delete(self):
+        """Индекс обновляется при изменении и удалении поста."""
+        def found(query):
+            return self.client.get(reverse('posts:search'),
+                                   {'q': query}).context['posts']
+
+        post, deleted = self.posts[2], self.posts[3]
+        self.assertEqual(found('только'), [post])
+        self.assertEqual(found('мышь'), [deleted])
+        post.text = 'Лиса'
+        post.save()
+        deleted.delete()
+        self.assertEqual(found('только'), [])
+        self.assertEqual(found('мышь'), [])
+        self.assertEqual(found('лиса'), [post])
+
+    def test_rebuild_search_index(self):
+        """Команда rebuild_search_index восстанавливает индекс."""
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM posts_post_fts')
+        call_command('rebuild_search_index', chunk_size=3, stdout=StringIO())
+        response = self.client.get(reverse('posts:search'), {'q': 'пёс'})
+        self.assertEqual(set(response.context['posts']),
+                         {self.posts[0], self.posts[2]})
+
+
+@override_settings(COMMENTS_ON_PAGE=2)
+class CommentsPaginationTest(TestCase):
+    NUM_COMMENTS = 5
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='Автор')
+        self.client.force_login(self.user)
+        self.post = Post.objects.create(author=self.user, text='Пост')
+        self.comments = [
+            Comment.objects.create(post=self.post, author=self.user,
+                                   text=f'Комментарий {i}')
+            for i in range(self.NUM_COMMENTS)
+        ]
+
+    def test_post_detail_renders_first_comments(self):
+        """На странице поста первые комментарии с авторами
+        выводятся фиксированным числом запросов."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        with self.assertNumQueries(5):
+            response = self.client.get(url)
+        self.assertEqual(response.context['comments'], self.comments[:2])
+        self.assertIsNotNone(response.context['next_comments'])
+
+    def test_comments_fragment_and_json(self):
+        """Следующие комментарии отдаются фрагментом и в JSON."""
+        url = reverse('posts:post_comments', kwargs={'post_id': self.post.pk})
+        response = self.client.get(url, {'format': 'json'})
+        data = response.json()
+        self.assertEqual([item['id'] for item in data['comments']],
+                         [comment.pk for comment in self.comments[:2]])
+        response = self.client.get(url, {'from': data['next']})
+        self.assertTemplateUsed(response, 'posts/includes/comments.html')
+        self.assertEqual(response.context['comments'], self.comments[2:4])
+        response = self.client.get(
+            url, {'from': response.context['next_comments'],
+                  'format': 'json'})
+        self.assertEqual(response.json()['comments'][0]['id'],
+                         self.comments[4].pk)
+        self.assertIsNone(response.json()['next'])
+
+    def test_add_comment_redirects_to_its_slice(self):
+        """После комментария пользователь попадает на срез с ним."""
+        response = self.client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.pk}),
+            {'text': 'Новый комментарий'})
+        comment = Comment.objects.latest('pk')
+        self.assertTrue(response.url.endswith(f'#comment-{comment.pk}'))
+        response = self.client.get(response.url)
+        self.assertEqual(response.context['comments'],
+                         [self.comments[4], comment])
+        self.assertContains(response, 'Первые комментарии')
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(title='Группа', slug='etag-group')
+        cls.post = Post.objects.create(text='Пост', author=cls.user,
+                                       group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_unchanged_pages_answer_304(self):
+        """Повторный запрос с ETag получает 304 до рендера шаблона."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                with self.assertNumQueries(1 if 'posts/' in url else 0):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+
+    def test_changes_update_etag(self):
+        """Новый комментарий и новый пост меняют ETag."""
+        detail = reverse('posts:post_detail',
+                         kwargs={'post_id': self.post.pk})
+        index = reverse('posts:index')
+        detail_etag = self.client.get(detail)['ETag']
+        index_etag = self.client.get(index)['ETag']
+        Comment.objects.create(post=self.post, author=self.user,
+                               text='Комментарий')
+        self.assertEqual(
+            self.client.get(detail, HTTP_IF_NONE_MATCH=detail_etag
+                            ).status_code, 200)
+        self.assertEqual(
+            self.client.get(index, HTTP_IF_NONE_MATCH=index_etag
+                            ).status_code, 200)
+
+    def test_if_modified_since(self):
+        """Last-Modified сдвигается при удалении поста."""
+        index = reverse('posts:index')
+        modified = self.client.get(index)['Last-Modified']
+        self.assertEqual(
+            self.client.get(index, HTTP_IF_MODIFIED_SINCE=modified
+                            ).status_code, 304)
+        with mock.patch('posts.utils.time.time',
+                        return_value=time.time() + 60):
+            Post.objects.get(pk=self.post.pk).delete()
+        response = self.client.get(index, HTTP_IF_MODIFIED_SINCE=modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['Last-Modified'], modified)
+
+
+class CardCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author')
+        cls.edited = Post.objects.create(text='Старый текст', author=cls.user)
+        cls.untouched = Post.objects.create(text='Другой', author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_edit_invalidates_only_its_card(self):
+        """Правка поста меняет ключ только его карточки."""
+        self.client.get(reverse('posts:index'))
+        untouched_key = _card_key(self.untouched, True, {})
+        self.assertIsNotNone(cache.get(untouched_key))
+        self.client.post(
+            reverse('posts:post_edit', args=(self.edited.pk,)),
+            data={'text': 'Новый текст'},
+        )
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'Новый текст')
+        self.assertNotContains(response, 'Старый текст')
+        self.assertIsNotNone(cache.get(untouched_key))
+        self.untouched.refresh_from_db()
+        self.assertEqual(_card_key(self.untouched, True, {}), untouched_key)
+
+    def test_author_and_group_changes_refresh_cards(self):
+        """Новое имя автора и удалённая группа видны в карточках сразу."""
+        group = Group.objects.create(title='Группа', slug='card-group',
+                                     description='Описание')
+        Post.objects.filter(pk=self.edited.pk).update(group=group)
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'card-group')
+        author = User.objects.get(pk=self.user.pk)
+        author.first_name = 'Переименованный'
+        author.save()
+        group.delete()
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'Переименованный')
+        self.assertNotContains(response, 'card-group')
+
+
+class ExportTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='export-group')
+        cls.posts = [
+            Post.objects.create(text=f'Пост {number}', author=cls.user,
+                                group=cls.group)
+            for number in range(3)
+        ]
+        Comment.objects.create(post=cls.posts[0], author=cls.reader,
+                               text='Комментарий')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.url = reverse('posts:profile_export',
+                           kwargs={'username': self.user.username})
+
+    def test_ndjson_export_streams_posts_with_comments(self):
+        """Выгрузка NDJSON отдаёт посты по возрастанию id с комментариями."""
+        with override_settings(EXPORT_CHUNK_SIZE=2):
+            response = self.client.get(self.url)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'],
+                         'application/x-ndjson; charset=utf-8')
+        rows = [json.loads(line) for line in
+                b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['id'] for row in rows],
+                         [post.pk for post in self.posts])
+        self.assertEqual(rows[0]['group'], self.group.slug)
+        self.assertEqual([comment['text'] for comment in rows[0]['comments']],
+                         ['Комментарий'])
+        self.assertEqual(rows[1]['comments'], [])
+
+    def test_csv_export_is_gzipped_on_request(self):
+        """CSV сжимается, если клиент принимает gzip."""
+        response = self.client.get(self.url, {'format': 'csv'},
+                                   HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        content = gzip.decompress(b''.join(response.streaming_content))
+        rows = list(csv.DictReader(content.decode().splitlines()))
+        self.assertEqual(len(rows), len(self.posts))
+        self.assertEqual(rows[0]['text'], 'Пост 0')
+
+    def test_gzip_refused_by_q_value(self):
+        """gzip;q=0 — отказ от сжатия, Vary остаётся в ответе."""
+        for header, compressed in (('gzip;q=0, deflate', False),
+                                   ('deflate, *;q=0.5', True),
+                                   ('*, gzip;q=0', False),
+                                   ('GZIP; q=0.8', True)):
+            with self.subTest(header=header):
+                response = self.client.get(self.url,
+                                           HTTP_ACCEPT_ENCODING=header)
+                self.assertEqual(response.has_header('Content-Encoding'),
+                                 compressed)
+                self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_export_access(self):
+        """Чужие посты и группы выгружает только персонал."""
+        group_url = reverse('posts:group_export',
+                            kwargs={'slug': self.group.slug})
+        self.assertEqual(
+            self.client.get(self.url, {'format': 'xml'}).status_code, 404)
+        self.client.force_login(self.reader)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.assertEqual(self.client.get(group_url).status_code, 403)
+        self.reader.is_staff = True
+        self.reader.save()
+        self.assertEqual(self.client.get(group_url).status_code, 200)
+
+    def test_export_command(self):
+        """Команда export_posts пишет ту же выгрузку в файл."""
+        with tempfile.NamedTemporaryFile(suffix='.ndjson.gz') as output:
+            call_command('export_posts', '--group', self.group.slug,
+                         '--output', output.name, '--gzip')
+            with gzip.open(output.name, 'rt', encoding='utf-8') as file:
+                rows = [json.loads(line) for line in file]
+        self.assertEqual(len(rows), len(self.posts))
+
+
+class ArchiveTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(title='Группа', slug='archive-group')
+        posts = [
+            Post.objects.create(text=f'Пост {number}', author=cls.user,
+                                group=cls.group)
+            for number in range(settings.POST_ON_PAGE + 3)
+        ]
+        cls.old = posts[:3]
+        Post.objects.filter(pk__in=[post.pk for post in cls.old]).update(
+            pub_date=timezone.now() - timedelta(days=400))
+        Comment.objects.create(post=cls.old[0], author=cls.user,
+                               text='Старый комментарий')
+        call_command('archive_posts', days=365, stdout=StringIO())
+
+    def setUp(self):
+        cache.clear()
+
+    def test_old_posts_moved_with_comments(self):
+        """Старые посты и их комментарии переезжают в архив с прежними id."""
+        self.assertEqual(Post.objects.count(), settings.POST_ON_PAGE)
+        self.assertQuerysetEqual(
+            ArchivedPost.objects.order_by('pk').values_list('pk', flat=True),
+            [post.pk for post in self.old], transform=int)
+        self.assertFalse(Comment.objects.exists())
+        self.assertEqual(ArchivedComment.objects.get().post_id,
+                         self.old[0].pk)
+        self.user.stats.refresh_from_db()
+        self.assertEqual(self.user.stats.posts_count,
+                         settings.POST_ON_PAGE + 3)
+
+    def test_feeds_fall_through_to_archive(self):
+        """Профиль и группа дочитывают архив после горячих постов."""
+        urls = (
+            reverse('posts:profile', kwargs={'username': self.user}),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                first = self.client.get(url).context['page_obj']
+                self.assertFalse(any(post.archived for post in first))
+                cursor = first.paginator.next_cursor
+                second = self.client.get(url, {'after': cursor}
+                                         ).context['page_obj']
+                self.assertEqual([post.pk for post in second],
+                                 [post.pk for post in self.old[::-1]])
+                back = self.client.get(
+                    url, {'before': second.paginator.previous_cursor}
+                ).context['page_obj']
+                self.assertEqual(list(back), list(first))
+                numbered = self.client.get(url, {'page': 2}
+                                           ).context['page_obj']
+                self.assertEqual(numbered.paginator.count,
+                                 settings.POST_ON_PAGE + 3)
+                self.assertEqual(list(numbered), list(second))
+
+    @override_settings(POST_ON_PAGE=1)
+    def test_deep_page_reads_archive_with_offset(self):
+        """Страница за концом горячих постов читает из архива
+        только свой срез, а не весь архив с начала."""
+        url = reverse('posts:profile', kwargs={'username': self.user})
+        last = Post.objects.count() + len(self.old)
+        with CaptureQueriesContext(connection) as queries:
+            page = self.client.get(url, {'page': last}).context['page_obj']
+        self.assertEqual([post.pk for post in page], [self.old[0].pk])
+        archived = [query['sql'] for query in queries.captured_queries
+                    if 'posts_archivedpost' in query['sql']
+                    and 'LIMIT' in query['sql']]
+        self.assertEqual(len(archived), 1)
+        self.assertIn(f'LIMIT 1 OFFSET {len(self.old) - 1}', archived[0])
+
+    def test_archive_writes_and_reads_primary(self):
+        """С репликами архивация читает и удаляет в основной базе."""
+        post = Post.objects.create(text='Под архив', author=self.user)
+        Post.objects.filter(pk=post.pk).update(
+            pub_date=timezone.now() - timedelta(days=400))
+        with self.settings(DATABASE_REPLICAS=['replica']):
+            moved = archive_posts(timezone.now() - timedelta(days=365), 10)
+        self.assertEqual(moved, 1)
+        self.assertFalse(Post.objects.filter(pk=post.pk).exists())
+        self.assertTrue(ArchivedPost.objects.filter(pk=post.pk).exists())
+
+    def test_old_hot_post_merged_with_archive(self):
+        """Импортированный мимо архива старый пост не прячет архив."""
+        oldest = Post.objects.create(text='Очень старый', author=self.user)
+        Post.objects.filter(pk=oldest.pk).update(
+            pub_date=timezone.now() - timedelta(days=500))
+        expected = [post.pk for post in self.old[::-1]] + [oldest.pk]
+        url = reverse('posts:profile', kwargs={'username': self.user})
+        seen = []
+        params = {}
+        while True:
+            page = self.client.get(url, params).context['page_obj']
+            seen += [post.pk for post in page]
+            if page.paginator.next_cursor is None:
+                break
+            params = {'after': page.paginator.next_cursor}
+        self.assertEqual(seen[-4:], expected)
+        self.assertEqual(len(seen), settings.POST_ON_PAGE + 4)
+
+    def test_archived_post_detail_is_read_only(self):
+        """Архивный пост открывается с комментариями, но без формы."""
+        self.client.force_login(self.user)
+        url = reverse('posts:post_detail', kwargs={'post_id': self.old[0].pk})
+        response = self.client.get(url)
+        self.assertContains(response, 'Старый комментарий')
+        self.assertNotContains(response, 'Добавить комментарий')
+        self.assertEqual(self.client.get(
+            url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
@@ -0,0 +1,151 @@
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from PIL import features
+from sorl.thumbnail import default
+
+from .models import ThumbnailSet
+from .utils import FEED_VERSION_KEY, bump_version
+
+logger = logging.getLogger(__name__)
+
+# Наборы миниатюр: пропорции кадра, ширины для srcset и форматы.
+# Первый формат отдаётся браузерам, которые его понимают,
+# последний служит запасным вариантом для <img>.
+THUMBNAIL_PRESETS = {
+    'feed': {
+        'size': (960, 339),
+        'widths': (320, 640, 960),
+        'formats': ('WEBP', 'JPEG'),
+        'options': {'crop': 'center', 'upscale': True},
+        'sizes': '(min-width: 992px) 960px, 100vw',
+    },
+}
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            thread_name_prefix='thumbnails',
+        )
+    return _executor
+
+
+def supported_formats(preset_name):
+    """Форматы набора, которые умеет кодировать установленный Pillow."""
+    return [
+        image_format
+        for image_format in THUMBNAIL_PRESETS[preset_name]['formats']
+        if image_format != 'WEBP' or features.check('webp')
+    ]
+
+
+def variants(preset_name):
+    """Пары (формат, ширина, geometry, options) для всех размеров набора."""
+    preset = THUMBNAIL_PRESETS[preset_name]
+    width, height = preset['size']
+    for image_format in supported_formats(preset_name):
+        for variant_width in preset['widths']:
+            variant_height = round(variant_width * height / width)
+            options = dict(preset['options'], format=image_format)
+            yield (image_format, variant_width,
+                   f'{variant_width}x{variant_height}', options)
+
+
+def _cache_key(name, preset_name):
+    return f'posts:thumbnails:{preset_name}:{md5(name.encode()).hexdigest()}'
+
+
+def generate(name):
+    """Создаёт недостающие миниатюры картинки и записывает их в ThumbnailSet.
+
+    Одинаковые загрузки хранятся одним файлом, поэтому набор,
+    уже созданный для этого имени, повторно не считается. Новый
+    набор сбрасывает версию лент: закэшированные страницы и ETag
+    со заглушкой вместо картинки становятся недействительными.
+    """
+    ready_presets = set(ThumbnailSet.objects.filter(image=name).values_list(
+        'preset', flat=True))
+    for preset_name in THUMBNAIL_PRESETS:
+        if preset_name in ready_presets:
+            continue
+        ready = []
+        for image_format, width, geometry, options in variants(preset_name):
+            thumbnail = default.backend.get_thumbnail(name, geometry,
+                                                      **options)
+            ready.append([image_format, width, thumbnail.name,
+                          thumbnail.width, thumbnail.height])
+        ThumbnailSet.objects.update_or_create(
+            image=name, preset=preset_name,
+            defaults={'variants': json.dumps(ready)},
+        )
+        cache.set(_cache_key(name, preset_name), ready,
+                  settings.THUMBNAIL_CACHE_TIMEOUT)
+        bump_version(FEED_VERSION_KEY)
+
+
+def resolve(names, preset_name):
+    """Находит готовые миниатюры для набора картинок разом.
+
+    Сначала один get_many к кэшу, затем один запрос к ThumbnailSet
+    для промахов. Возвращает словарь имя картинки -> список
+    [формат, ширина, имя миниатюры, ширина, высота].
+    """
+    keys = {_cache_key(name, preset_name): name for name in set(names)}
+    resolved = {
+        keys[key]: ready for key, ready in cache.get_many(keys).items()
+    }
+    missing = set(keys.values()) - set(resolved)
+    if missing:
+        found = {
+            image: json.loads(ready)
+            for image, ready in ThumbnailSet.objects.filter(
+                preset=preset_name, image__in=missing
+            ).values_list('image', 'variants')
+        }
+        cache.set_many(
+            {_cache_key(name, preset_name): ready
+             for name, ready in found.items()},
+            settings.THUMBNAIL_CACHE_TIMEOUT,
+        )
+        resolved.update(found)
+    return resolved
+
+
+def _generate_logged(name):
+    try:
+        generate(name)
+    except Exception:
+        logger.exception('Не удалось создать миниатюру для %s', name)
+
+
+def _generate_in_worker(name):
+    try:
+        _generate_logged(name)
+    finally:
+        connections.close_all()
+
+
+def schedule(image):
+    """Ставит генерацию миниатюр в фоновый пул после коммита.
+
+    При THUMBNAIL_WORKERS = 0 миниатюры создаются сразу после
+    коммита в том же потоке.
+    """
+    if not image:
+        return
+    name = image.name
+    if not settings.THUMBNAIL_WORKERS:
+        transaction.on_commit(lambda: _generate_logged(name))
+        return
+    transaction.on_commit(
+        lambda: _get_executor().submit(_generate_in_worker, name))
@@ -0,0 +1,161 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Q
+from django.utils import timezone
+
+from core.routers import primary
+
+from .models import Follow, Post, TimelineEntry, UserStats
+from .utils import batches
+
+FANOUT_ON_READ_KEY = 'posts:fanout_on_read_authors'
+TIMELINE_KEY = ('feed_date', 'feed_post')
+
+
+def fanout_on_read_authors():
+    """Авторы, чьи посты читаются напрямую при открытии ленты.
+
+    Режим хранится в UserStats.fanout_on_read и переключается
+    update_fanout_mode; набор кэшируется на TIMELINE_FANOUT_TIMEOUT
+    секунд и сбрасывается при переключении.
+    """
+    def popular_authors():
+        return frozenset(UserStats.objects.filter(
+            fanout_on_read=True
+        ).values_list('user', flat=True))
+    return cache.get_or_set(FANOUT_ON_READ_KEY, popular_authors,
+                            settings.TIMELINE_FANOUT_TIMEOUT)
+
+
+def update_fanout_mode(batch_size):
+    """Переводит авторов между раскладкой по лентам и чтением
+    по запросу, возвращает число перешедших в каждую сторону.
+
+    Авторы, у которых подписчиков больше TIMELINE_FANOUT_LIMIT,
+    переходят в чтение по запросу. Вышедшим из него посты
+    дописываются в ленты подписчиков, пока флаг ещё стоит и посты
+    читаются напрямую; после снятия флага второй проход добирает
+    посты, опубликованные за время первого. Дописывание — это
+    посты × подписчики строк, поэтому оно идёт в команде,
+    а не в запросе пользователя.
+    """
+    with primary():
+        limit = settings.TIMELINE_FANOUT_LIMIT
+        entered = UserStats.objects.filter(
+            fanout_on_read=False, followers_count__gt=limit
+        ).update(fanout_on_read=True)
+        left = list(UserStats.objects.filter(
+            fanout_on_read=True, followers_count__lte=limit
+        ).values_list('user', flat=True))
+        for author_id in left:
+            started = timezone.now()
+            follows = Follow.objects.filter(author=author_id)
+            for ids in batches(follows, batch_size):
+                _write_follows(ids)
+            UserStats.objects.filter(user=author_id).update(
+                fanout_on_read=False)
+            cache.delete(FANOUT_ON_READ_KEY)
+            for ids in batches(follows, batch_size):
+                _write_follows(ids, since=started)
+        cache.delete(FANOUT_ON_READ_KEY)
+    return entered, len(left)
+
+
+def _write(entries):
+    TimelineEntry.objects.bulk_create(
+        entries,
+        batch_size=settings.TIMELINE_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def fan_out(post):
+    if post.author_id in fanout_on_read_authors():
+        return
+    followers = Follow.objects.filter(
+        author=post.author_id
+    ).values_list('user', flat=True)
+    _write(
+        TimelineEntry(user_id=user_id, post=post,
+                      author_id=post.author_id, pub_date=post.pub_date)
+        for user_id in followers.iterator()
+    )
+
+
+def backfill(follow):
+    if follow.author_id in fanout_on_read_authors():
+        return
+    posts = Post.objects.filter(
+        author=follow.author_id
+    ).values_list('pk', 'pub_date')
+    _write(
+        TimelineEntry(user_id=follow.user_id, post_id=pk,
+                      author_id=follow.author_id, pub_date=pub_date)
+        for pk, pub_date in posts.iterator()
+    )
+
+
+def _write_follows(ids, since=None):
+    """Дописывает в ленты посты авторов из подписок с данными pk,
+    с since — только опубликованные не раньше since."""
+    followers = {}
+    for user_id, author_id in Follow.objects.filter(
+            pk__in=ids).values_list('user', 'author'):
+        followers.setdefault(author_id, []).append(user_id)
+    posts = Post.objects.filter(author__in=followers)
+    if since is not None:
+        posts = posts.filter(pub_date__gte=since)
+    posts = posts.values_list('pk', 'author', 'pub_date')
+    _write(
+        TimelineEntry(user_id=user_id, post_id=pk, author_id=author_id,
+                      pub_date=pub_date)
+        for pk, author_id, pub_date in posts.iterator()
+        for user_id in followers[author_id]
+    )
+
+
+def rebuild(batch_size):
+    """Дописывает в ленты все посты авторов из подписок.
+
+    Подписки обходятся пачками по pk, записи ленты пишутся потоком
+    через bulk_create с пропуском уже существующих, поэтому вызов
+    можно повторять. Нужен после массового импорта, который
+    обходит сигналы.
+    """
+    popular = fanout_on_read_authors()
+    written = 0
+    for ids in batches(Follow.objects.exclude(author__in=popular),
+                       batch_size):
+        _write_follows(ids)
+        written += len(ids)
+    return written
+
+
+def prune(follow):
+    TimelineEntry.objects.filter(
+        user=follow.user_id,
+        author=follow.author_id,
+    ).delete()
+
+
+def timeline_posts(user):
+    """Посты ленты подписок пользователя.
+
+    Ключ сортировки TIMELINE_KEY берётся из самой ленты, чтобы
+    страница читалась по индексу (user, pub_date, post) без
+    сортировки постов.
+    """
+    popular = fanout_on_read_authors()
+    if popular:
+        followed = list(Follow.objects.filter(
+            user=user, author__in=popular
+        ).values_list('author', flat=True))
+        if followed:
+            entries = TimelineEntry.objects.filter(user=user).values('post')
+            return Post.objects.filter(
+                Q(pk__in=entries) | Q(author__in=followed)
+            ).annotate(feed_date=F('pub_date'), feed_post=F('pk'))
+    return Post.objects.filter(timeline_entries__user=user).annotate(
+        feed_date=F('timeline_entries__pub_date'),
+        feed_post=F('timeline_entries__post'),
+    )
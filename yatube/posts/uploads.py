@@ -0,0 +1,77 @@
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import InMemoryUploadedFile
+from PIL import Image, ImageOps
+
+# Форматы, в которых сохраняется уменьшенная картинка. Статичные
+# картинки других форматов (GIF, BMP и прочие) пересохраняются
+# в PNG, анимация сохраняется как есть после проверки размера.
+NORMALIZED_FORMATS = {
+    'JPEG': ('.jpg', 'image/jpeg'),
+    'PNG': ('.png', 'image/png'),
+    'WEBP': ('.webp', 'image/webp'),
+}
+
+EXIF_ORIENTATION = 0x0112
+
+
+def _check_pixels(image):
+    if image.width * image.height > settings.IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            'Картинка слишком большая: %(width)s×%(height)s пикселей.',
+            code='too_many_pixels',
+            params={'width': image.width, 'height': image.height},
+        )
+
+
+def normalize_image(upload):
+    """Уменьшает загруженную картинку до IMAGE_MAX_SIZE.
+
+    Размер проверяется по заголовку до декодирования, чтобы
+    не распаковывать «бомбы». JPEG декодируется в draft-режиме
+    сразу в уменьшенном масштабе, поворот из EXIF применяется
+    к пикселям, ICC-профиль переносится в новый файл. Если менять
+    нечего или картинка анимирована, возвращается исходный файл.
+    """
+    upload.seek(0)
+    try:
+        image = Image.open(upload)
+    except Image.DecompressionBombError:
+        raise ValidationError('Картинка слишком большая.',
+                              code='too_many_pixels')
+    _check_pixels(image)
+    if getattr(image, 'is_animated', False):
+        upload.seek(0)
+        return upload
+    max_width, max_height = settings.IMAGE_MAX_SIZE
+    orientation = image.getexif().get(EXIF_ORIENTATION, 1)
+    if (image.width <= max_width and image.height <= max_height
+            and orientation == 1):
+        upload.seek(0)
+        return upload
+    image_format = image.format
+    if image_format not in NORMALIZED_FORMATS:
+        image_format = 'PNG'
+    icc_profile = image.info.get('icc_profile')
+    if image_format == 'JPEG':
+        longest = max(max_width, max_height)
+        image.draft('RGB', (longest, longest))
+    elif image.mode in ('1', 'P'):
+        image = image.convert('RGBA')
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((max_width, max_height), Image.LANCZOS)
+    extension, content_type = NORMALIZED_FORMATS[image_format]
+    buffer = BytesIO()
+    if image_format == 'JPEG':
+        image.convert('RGB').save(
+            buffer, 'JPEG', quality=settings.IMAGE_JPEG_QUALITY,
+            optimize=True, progressive=True, icc_profile=icc_profile)
+    else:
+        image.save(buffer, image_format, optimize=True,
+                   icc_profile=icc_profile)
+    name = os.path.splitext(os.path.basename(upload.name))[0] + extension
+    return InMemoryUploadedFile(buffer, 'image', name, content_type,
+                                buffer.tell(), None)
@@ -1,9 +1,304 @@
+import re
+import time
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from functools import wraps
+from hashlib import md5
+
 from django.conf import settings
-from django.core.paginator import Paginator
+from django.core.cache import cache
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+from core.routers import primary
+
+CURSOR_SEPARATOR = '|'
+FEED_KEY = ('pub_date', 'pk')
+POST_COUNT_VERSION_KEY = 'posts:count_version'
+FEED_VERSION_KEY = 'posts:feed_version'
+HOLE_PATTERN = re.compile(r'<!--hole:(.+?)-->')
+
+
+def _initial_version():
+    return time.time_ns() // 1_000_000
+
+
+def get_version(key):
+    """Номер версии, от которого зависят ключи кэша.
+
+    Пропавший из кэша номер (например, после вытеснения) заводится
+    заново от текущего времени, а не с 1, чтобы не ожили записи,
+    сохранённые под старыми номерами.
+    """
+    return cache.get_or_set(key, _initial_version, None)
+
+
+def bump_version(key):
+    """Увеличивает номер версии атомарным incr кэша.
+
+    Рядом запоминается время изменения, по нему строятся
+    Last-Modified и выбор базы для чтения сразу после записи.
+    """
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, _initial_version(), None)
+    cache.set(f'{key}:changed', time.time(), None)
+
+
+def changed_at(key, default=None):
+    """Время последнего изменения версии в секундах эпохи.
+
+    Без default пропавшее из кэша время заводится от текущего
+    момента: страница считается изменённой, а не старой.
+    """
+    if default is not None:
+        return cache.get(f'{key}:changed', default)
+    return cache.get_or_set(f'{key}:changed', time.time, None)
+
+
+def encode_cursor(*values):
+    """Упаковывает значения ключа сортировки в непрозрачный токен."""
+    raw = CURSOR_SEPARATOR.join(str(value) for value in values)
+    return urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Распаковывает токен курсора в список строк или возвращает None."""
+    if not token:
+        return None
+    try:
+        padding = '=' * (-len(token) % 4)
+        raw = urlsafe_b64decode(token + padding).decode()
+    except (BinasciiError, UnicodeDecodeError, ValueError):
+        return None
+    return raw.split(CURSOR_SEPARATOR)
+
+
+def decode_position(token):
+    """Распаковывает курсор (дата, id) или возвращает None."""
+    values = decode_cursor(token)
+    if not values or len(values) != 2 or not values[1].isdigit():
+        return None
+    try:
+        date = parse_datetime(values[0])
+    except ValueError:
+        return None
+    if date is None:
+        return None
+    return date, int(values[1])
+
+
+def comment_slice(post, token, limit):
+    """Возвращает до limit комментариев поста по порядку (created, id),
+    начиная с позиции token включительно, и курсор следующего среза."""
+    comments = post.comments.select_related('author').only(
+        'text', 'created', 'post', 'author', 'author__username'
+    ).order_by('created', 'pk')
+    position = decode_position(token)
+    if position is not None:
+        created, pk = position
+        comments = comments.filter(
+            Q(created__gt=created) | Q(created=created, pk__gte=pk)
+        )
+    rows = list(comments[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = comment_cursor(rows[limit])
+        rows = rows[:limit]
+    return rows, next_cursor
+
+
+def comment_cursor(comment):
+    return encode_cursor(comment.created.isoformat(), comment.pk)
+
 
+def comment_slice_start(comment, limit):
+    """Курсор среза, в котором комментарий стоит на своём месте.
 
-def paginator_work(request, post_list):
-    paginator = Paginator(post_list, settings.POST_ON_PAGE)
+    Срезы отсчитываются от первого комментария по limit штук,
+    как при переходе по ссылкам «Следующие комментарии». Для
+    первого среза возвращается None.
+    """
+    comments = comment.post.comments.order_by('created', 'pk')
+    position = comments.filter(
+        Q(created__lt=comment.created)
+        | Q(created=comment.created, pk__lt=comment.pk)
+    ).count()
+    start = position - position % limit
+    if not start:
+        return None
+    return comment_cursor(comments[start])
+
+
+def batches(queryset, batch_size):
+    """Отдаёт первичные ключи пачками, двигаясь по возрастанию pk."""
+    last_pk = 0
+    while True:
+        ids = list(queryset.filter(pk__gt=last_pk).order_by('pk').values_list(
+            'pk', flat=True)[:batch_size])
+        if not ids:
+            return
+        yield ids
+        last_pk = ids[-1]
+
+
+class CursorPaginator(Paginator):
+    """Пагинатор по ключу (дата, id) без COUNT и OFFSET.
+
+    Страница выбирается переходом по индексу от позиции,
+    закодированной в курсоре, поэтому стоимость запроса не зависит
+    от глубины страницы. Поля ключа передаются в key: по умолчанию
+    это pub_date и pk поста. Курсоры соседних страниц хранятся
+    в самом пагинаторе, а num_pages подбирается так, чтобы
+    has_next и has_previous стандартной Page работали без COUNT.
+    """
+    is_cursor = True
+    next_cursor = None
+    previous_cursor = None
+
+    def __init__(self, object_list, per_page, key=FEED_KEY, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.key = key
+
+    def _cursor(self, post):
+        date_field, id_field = self.key
+        return encode_cursor(getattr(post, date_field).isoformat(),
+                             getattr(post, id_field))
+
+    def _seek(self, queryset, position, lookup):
+        date_field, id_field = self.key
+        date, pk = position
+        return queryset.filter(
+            Q(**{f'{date_field}__{lookup}': date})
+            | Q(**{date_field: date, f'{id_field}__{lookup}': pk})
+        )
+
+    def _page(self, rows, next_cursor, previous_cursor):
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        number = 1 if previous_cursor is None else 2
+        self.num_pages = number if next_cursor is None else number + 1
+        return Page(rows, number, self)
+
+    def get_cursor_page(self, after=None, before=None):
+        queryset = self.object_list
+        position = decode_position(before)
+        if position is not None:
+            rows = list(self._seek(queryset, position, 'gt').order_by(
+                *self.key)[:self.per_page + 1])
+            if len(rows) <= self.per_page:
+                return self.get_cursor_page()
+            rows = rows[:self.per_page][::-1]
+            return self._page(rows, self._cursor(rows[-1]),
+                              self._cursor(rows[0]))
+        position = decode_position(after)
+        if position is not None:
+            queryset = self._seek(queryset, position, 'lt')
+        rows = list(queryset.order_by(
+            *(f'-{field}' for field in self.key))[:self.per_page + 1])
+        has_next = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        next_cursor = previous_cursor = None
+        if has_next:
+            next_cursor = self._cursor(rows[-1])
+        if position is not None and rows:
+            previous_cursor = self._cursor(rows[0])
+        return self._page(rows, next_cursor, previous_cursor)
+
+
+class WindowPaginator(Paginator):
+    """Нумерованный пагинатор с кэшируемым числом записей.
+
+    COUNT выполняется один раз на версию ленты и хранится
+    PAGE_COUNT_TIMEOUT секунд; версия сбрасывается сигналами
+    при создании и удалении постов и подписок. Вместо всего
+    page_range шаблону отдаётся окно соседних страниц.
+    """
+    page_window = range(0)
+
+    @cached_property
+    def count(self):
+        version = get_version(POST_COUNT_VERSION_KEY)
+        query = md5(str(self.object_list.query).encode()).hexdigest()
+        key = f'posts:count:{version}:{query}'
+        count = cache.get(key)
+        if count is None:
+            count = self.object_list.count()
+            cache.set(key, count, settings.PAGE_COUNT_TIMEOUT)
+        return count
+
+    def get_page(self, number):
+        page = super().get_page(number)
+        first = max(page.number - settings.PAGE_WINDOW, 1)
+        last = min(page.number + settings.PAGE_WINDOW, self.num_pages)
+        self.page_window = range(first, last + 1)
+        return page
+
+
+def paginator_work(request, post_list, key=FEED_KEY):
     page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    return page_obj
+    if page_number is not None:
+        post_list = post_list.order_by(*(f'-{field}' for field in key))
+        paginator = WindowPaginator(post_list, settings.POST_ON_PAGE)
+        return paginator.get_page(page_number)
+    paginator = CursorPaginator(post_list, settings.POST_ON_PAGE, key=key)
+    return paginator.get_cursor_page(after=request.GET.get('after'),
+                                     before=request.GET.get('before'))
+
+
+def fill_holes(request, content):
+    return HOLE_PATTERN.sub(
+        lambda match: render_to_string(match.group(1), request=request),
+        content,
+    )
+
+
+def cache_feed(view):
+    """Кэширует страницу ленты до следующего изменения постов.
+
+    Ключ строится из версии ленты, имени представления, пути
+    с параметрами страницы или курсора и признака авторизации.
+    Версию увеличивают сигналы сохранения и удаления постов,
+    комментариев и групп, поэтому записи живут FEED_CACHE_TIMEOUT
+    секунд, но новые данные видны сразу. Одновременные промахи
+    рендерят страницу один раз (см. TieredCache.get_or_compute).
+    Пока реплики могут отставать от последнего изменения,
+    страница для кэша собирается из основной базы. Шапка с именем
+    пользователя в кэш не попадает и дорисовывается на каждый запрос.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return view(request, *args, **kwargs)
+        version = get_version(FEED_VERSION_KEY)
+        path = md5(request.get_full_path().encode()).hexdigest()
+        key = (f'posts:feed:{version}:{view.__name__}:{path}:'
+               f'{int(request.user.is_authenticated)}')
+        rendered = []
+
+        def render():
+            request.cache_holes = True
+            changed = changed_at(FEED_VERSION_KEY, 0)
+            if time.time() - changed < settings.REPLICA_MAX_LAG:
+                with primary():
+                    response = view(request, *args, **kwargs)
+            else:
+                response = view(request, *args, **kwargs)
+            rendered.append(response)
+            if response.status_code == 200:
+                return response.content.decode(response.charset)
+
+        content = cache.get_or_compute(key, render,
+                                       settings.FEED_CACHE_TIMEOUT)
+        if not rendered:
+            return HttpResponse(fill_holes(request, content))
+        response = rendered[0]
+        response.content = fill_holes(
+            request, response.content.decode(response.charset))
+        return response
+    return wrapper
@@ -1,25 +1,46 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
+from django.urls import reverse
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import condition
+from core.db import immediate_atomic
+from core.routers import writes
 from posts.forms import CommentForm, PostForm
 
-from .models import Comment, Follow, Group, Post
-from .utils import paginator_work
-
-
-@cache_page(20)
+from . import images
+from .archive import FallThrough, find_post
+from .counters import get_stats
+from .etags import (feed_etag, feed_last_modified, post_etag,
+                    post_last_modified, profile_etag, profile_last_modified)
+from .export import CONTENT_TYPES, accepts_gzip, export
+from .follow_graph import follow_graph
+from .models import Follow, Group, Post
+from .search import search_posts
+from .thumbnails import schedule
+from .timeline import TIMELINE_KEY, timeline_posts
+from .utils import (cache_feed, comment_slice, comment_slice_start,
+                    paginator_work)
+
+
+@condition(etag_func=feed_etag, last_modified_func=feed_last_modified)
+@cache_feed
 def index(request):
-    post_list = Post.objects.select_related('group').all()
+    post_list = Post.objects.feed()
     context = {
         'page_obj': paginator_work(request, post_list),
     }
     return render(request, 'posts/index.html', context)
 
 
+@condition(etag_func=feed_etag, last_modified_func=feed_last_modified)
+@cache_feed
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.all()
+    post_list = FallThrough(group.posts.feed(), group.archived_posts.feed())
     context = {
         'group': group,
         'page_obj': paginator_work(request, post_list),
@@ -27,17 +48,16 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+@condition(etag_func=profile_etag,
+           last_modified_func=profile_last_modified)
 def profile(request, username):
     user = get_object_or_404(User, username=username)
     following = False
-    user_posts = user.posts.all()
+    user_posts = FallThrough(user.posts.feed(), user.archived_posts.feed())
     if request.user.is_authenticated:
-        following = Follow.objects.filter(
-            author=user,
-            user=request.user
-        ).exists()
+        following = follow_graph.is_following(request.user.pk, user.pk)
     context = {
-        'post_count': user_posts.count(),
+        'post_count': get_stats(user).posts_count,
         'page_obj': paginator_work(request, user_posts),
         'author': user,
         'following': following,
@@ -45,29 +65,74 @@ def profile(request, username):
     return render(request, 'posts/profile.html', context)
 
 
+@condition(etag_func=post_etag, last_modified_func=post_last_modified)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post.objects.prefetch_related('comments'),
-                             id=post_id)
-    author_posts_count = Post.objects.filter(author=post.author).count()
-    form = CommentForm()
-    comments = Comment.objects.filter(post=post)
+    post = find_post(post_id, 'author', 'group')
+    comments, next_comments = comment_slice(
+        post, request.GET.get('from'), settings.COMMENTS_ON_PAGE)
     context = {
         'post': post,
-        'post_count': author_posts_count,
-        'form': form,
+        'post_count': get_stats(post.author).posts_count,
+        'form': CommentForm(),
         'comments': comments,
+        'next_comments': next_comments,
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+def post_comments(request, post_id):
+    post = find_post(post_id)
+    comments, next_comments = comment_slice(
+        post, request.GET.get('from'), settings.COMMENTS_ON_PAGE)
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'comments': [
+                {
+                    'id': comment.pk,
+                    'author': comment.author.username,
+                    'text': comment.text,
+                    'created': comment.created.isoformat(),
+                }
+                for comment in comments
+            ],
+            'next': next_comments,
+        })
+    context = {
+        'post': post,
+        'comments': comments,
+        'next_comments': next_comments,
+    }
+    return render(request, 'posts/includes/comments.html', context)
+
+
+def save_post(form, **fields):
+    """Сохраняет пост из проверенной формы.
+
+    Картинка уже уменьшена в clean_image и записывается
+    в хранилище до транзакции, так что BEGIN IMMEDIATE держит
+    блокировку только на время записи строк.
+    """
+    post = form.save(commit=False)
+    for name, value in fields.items():
+        setattr(post, name, value)
+    upload = None
+    if post.image and not post.image._committed:
+        upload = post.image.file
+        post.image.save(post.image.name, upload, save=False)
+    with immediate_atomic():
+        post.save()
+        if upload is not None:
+            images.restore(post.image.name, upload)
+    return post
+
+
 @login_required
 def post_create(request):
     form = PostForm(request.POST or None,
                     files=request.FILES or None)
     if form.is_valid():
-        post = form.save(commit=False)
-        post.author = request.user
-        post.save()
+        post = save_post(form, author=request.user)
+        schedule(post.image)
         return redirect('posts:profile', post.author.username)
     return render(request, 'posts/create_post.html', {'form': form})
 
@@ -81,7 +146,9 @@ def post_edit(request, post_id):
                     files=request.FILES or None,
                     instance=post)
     if form.is_valid():
-        form.save()
+        post = save_post(form)
+        if 'image' in form.changed_data:
+            schedule(post.image)
         return redirect('posts:post_detail', post_id=post_id)
     return render(request, 'posts/create_post.html', {
         'form': form, 'post': post, 'is_edit': True, })
@@ -95,30 +162,90 @@ def add_comment(request, post_id):
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
-        comment.save()
+        with immediate_atomic():
+            comment.save()
+        url = reverse('posts:post_detail', kwargs={'post_id': post_id})
+        start = comment_slice_start(comment, settings.COMMENTS_ON_PAGE)
+        if start is not None:
+            url = f'{url}?from={start}'
+        return redirect(f'{url}#comment-{comment.pk}')
     return redirect('posts:post_detail', post_id=post_id)
 
 
+def search(request):
+    query = request.GET.get('q', '').strip()
+    posts, next_cursor = search_posts(query, request.GET.get('after'),
+                                      settings.POST_ON_PAGE)
+    context = {
+        'query': query,
+        'posts': posts,
+        'next_cursor': next_cursor,
+    }
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
 def follow_index(request):
-    post_list = Post.objects.filter(author__following__user=request.user)
+    post_list = timeline_posts(request.user).feed()
     context = {
-        'page_obj': paginator_work(request, post_list),
+        'page_obj': paginator_work(request, post_list, key=TIMELINE_KEY),
     }
     return render(request, 'posts/follow.html', context)
 
 
+@writes
 @login_required
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     if author != request.user:
-        Follow.objects.get_or_create(author=author,
-                                     user=request.user)
+        with immediate_atomic():
+            Follow.objects.get_or_create(author=author,
+                                         user=request.user)
     return redirect('posts:profile', username=username)
 
 
+@writes
 @login_required
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
-    Follow.objects.filter(user=request.user, author=author).delete()
+    with immediate_atomic():
+        Follow.objects.filter(user=request.user, author=author).delete()
     return redirect('posts:profile', username=username)
+
+
+def export_response(request, querysets, filename):
+    export_format = request.GET.get('format', 'ndjson')
+    if export_format not in CONTENT_TYPES:
+        raise Http404
+    compress = accepts_gzip(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    response = StreamingHttpResponse(
+        export(querysets, export_format, settings.EXPORT_CHUNK_SIZE,
+               compress),
+        content_type=f'{CONTENT_TYPES[export_format]}; charset=utf-8',
+    )
+    if compress:
+        response['Content-Encoding'] = 'gzip'
+    patch_vary_headers(response, ('Accept-Encoding',))
+    response['Content-Disposition'] = (
+        f'attachment; filename="{filename}.{export_format}"')
+    return response
+
+
+@login_required
+def profile_export(request, username):
+    author = get_object_or_404(User, username=username)
+    if request.user != author and not request.user.is_staff:
+        raise PermissionDenied
+    return export_response(
+        request, [author.archived_posts.all(), author.posts.all()],
+        author.username)
+
+
+@login_required
+def group_export(request, slug):
+    if not request.user.is_staff:
+        raise PermissionDenied
+    group = get_object_or_404(Group, slug=slug)
+    return export_response(
+        request, [group.archived_posts.all(), group.posts.all()],
+        group.slug)
@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.base_user import AbstractBaseUser
+from django.core.cache import cache
+
+# Поля пользователя, которые хранятся в кэше. Остальные, в том
+# числе пароль, остаются отложенными и при обращении читаются из БД.
+CACHED_FIELDS = ('id', 'username', 'is_active', 'is_staff', 'is_superuser')
+
+
+def user_cache_key(user_id):
+    return f'users:user:{user_id}'
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend, который держит запись пользователя в кэше.
+
+    AuthenticationMiddleware достаёт пользователя на каждый запрос;
+    с кэшем это обходится без запроса к auth_user. В кэше лежат
+    только CACHED_FIELDS и хеш для проверки сессии, без хеша
+    пароля. Запись удаляется при любом сохранении пользователя,
+    в том числе при смене пароля.
+    """
+
+    def get_user(self, user_id):
+        key = user_cache_key(user_id)
+        record = cache.get(key)
+        if record is None:
+            user = super().get_user(user_id)
+            if user is None:
+                return None
+            record = {field: getattr(user, field) for field in CACHED_FIELDS}
+            record['session_auth_hash'] = user.get_session_auth_hash()
+            cache.set(key, record, settings.USER_CACHE_TIMEOUT)
+        user = self.user_from_record(record)
+        return user if self.user_can_authenticate(user) else None
+
+    @staticmethod
+    def user_from_record(record):
+        """Пользователь из записи кэша с отложенными остальными полями.
+
+        Пока пароль не загружен, хеш сессии берётся из записи.
+        После set_password или чтения пароля из БД хеш считается
+        заново, иначе update_session_auth_hash после смены пароля
+        положил бы в сессию старый хеш.
+        """
+        model = get_user_model()
+        user = model.from_db('default', CACHED_FIELDS, [
+            record[field.attname] for field in model._meta.concrete_fields
+            if field.attname in CACHED_FIELDS
+        ])
+        session_auth_hash = record['session_auth_hash']
+
+        def get_session_auth_hash():
+            if 'password' in user.get_deferred_fields():
+                return session_auth_hash
+            return AbstractBaseUser.get_session_auth_hash(user)
+        user.get_session_auth_hash = get_session_auth_hash
+        return user
@@ -0,0 +1,62 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from .backends import CachedModelBackend, user_cache_key
+
+User = get_user_model()
+
+
+class CachedAuthTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='auth',
+                                             password='old-secret-42')
+        self.client = Client()
+        self.client.login(username='auth', password='old-secret-42')
+
+    def test_warm_requests_skip_session_and_user_queries(self):
+        """Сессия и пользователь берутся из кэша без запросов к БД."""
+        url = reverse('posts:index')
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['user'], self.user)
+
+    def test_cached_record_has_no_password(self):
+        """В кэше лежат только нужные поля, пароль дочитывается из БД."""
+        self.client.get(reverse('posts:index'))
+        record = cache.get(user_cache_key(self.user.pk))
+        self.assertNotIn('password', record)
+        self.assertNotIn(self.user.password, record.values())
+        user = CachedModelBackend().get_user(self.user.pk)
+        self.assertEqual(user.username, 'auth')
+        with self.assertNumQueries(1):
+            self.assertTrue(user.check_password('old-secret-42'))
+
+    def test_inactive_cached_user_rejected(self):
+        """Неактивный пользователь из кэша не проходит аутентификацию."""
+        self.client.get(reverse('posts:index'))
+        key = user_cache_key(self.user.pk)
+        cache.set(key, {**cache.get(key), 'is_active': False})
+        self.assertIsNone(CachedModelBackend().get_user(self.user.pk))
+
+    def test_password_change_drops_cached_user(self):
+        """Смена пароля убирает пользователя из кэша."""
+        self.client.get(reverse('posts:index'))
+        self.assertIsNotNone(cache.get(user_cache_key(self.user.pk)))
+        response = self.client.post(reverse('users:password_change'), {
+            'old_password': 'old-secret-42',
+            'new_password1': 'new-secret-42',
+            'new_password2': 'new-secret-42',
+        })
+        self.assertRedirects(response, reverse('users:password_change_done'),
+                             fetch_redirect_response=False)
+        self.assertIsNone(cache.get(user_cache_key(self.user.pk)))
+        self.assertEqual(self.client.get(reverse('posts:follow_index')
+                                         ).status_code, 200)
+        other = Client()
+        other.login(username='auth', password='new-secret-42')
+        self.assertEqual(other.get(reverse('posts:index')).status_code, 200)
@@ -29,6 +29,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.ReplicaStickinessMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -53,6 +54,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'core.context_processors.year.year',
+                'core.context_processors.follows.follows',
             ],
         },
     },
@@ -62,11 +64,45 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'core.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': 60,
+        'OPTIONS': {
+            'timeout': 5,
+        },
     }
 }
 
+# Алиасы реплик из DATABASES. Пример для SQLite:
+# DATABASES['replica'] = dict(DATABASES['default'],
+#                             NAME=os.path.join(BASE_DIR, 'replica.sqlite3'))
+# DATABASE_REPLICAS = ['replica']
+# и периодический manage.py sync_replicas.
+DATABASE_REPLICAS = []
+
+DATABASE_ROUTERS = ['core.routers.PrimaryReplicaRouter']
+
+REPLICA_STICKY_COOKIE = 'primary_until'
+
+REPLICA_STICKY_SECONDS = 10
+
+REPLICA_MAX_LAG = 10
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'busy_timeout': 5000,
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -20000,
+    'temp_store': 'MEMORY',
+}
+
+AUTHENTICATION_BACKENDS = ['users.backends.CachedModelBackend']
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+USER_CACHE_TIMEOUT = 60 * 60
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -108,6 +144,29 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 POST_ON_PAGE = 10
 
+COMMENTS_ON_PAGE = 20
+
+PAGE_WINDOW = 2
+
+PAGE_COUNT_TIMEOUT = 60 * 5
+
+FEED_CACHE_TIMEOUT = 60 * 60
+
+CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+TIMELINE_FANOUT_LIMIT = 1000
+
+TIMELINE_FANOUT_TIMEOUT = 60 * 10
+
+TIMELINE_BATCH_SIZE = 500
+
+FOLLOW_GRAPH_MAX_USERS = 10000
+
+EXPORT_CHUNK_SIZE = 500
+
+POST_ARCHIVE_AGE_DAYS = 365
+POST_ARCHIVE_BATCH_SIZE = 500
+
 NUMBER_SYMBOL_POST = 15
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
@@ -116,8 +175,59 @@ MEDIA_URL = '/media/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+MEDIA_CACHE_MAX_AGE = 60 * 60 * 24 * 365
+
+# 'X-Accel-Redirect' для nginx или 'X-Sendfile' для Apache/lighttpd:
+# тогда байты файла отдаёт прокси, а не Python.
+MEDIA_SENDFILE_HEADER = None
+
+MEDIA_SENDFILE_PREFIX = '/internal-media/'
+
+IMAGE_MAX_SIZE = (2560, 2560)
+
+IMAGE_MAX_PIXELS = 50_000_000
+
+IMAGE_JPEG_QUALITY = 85
+
+# 0 — миниатюры создаются сразу после коммита в потоке запроса.
+THUMBNAIL_WORKERS = 0 if DEBUG else 2
+
+THUMBNAIL_CACHE_TIMEOUT = 60 * 60 * 24
+
 CACHES = {
     'default': {
+        'BACKEND': 'core.cache.TieredCache',
+        'LOCATION': 'yatube',
+        'OPTIONS': {
+            'L2': 'shared',
+            'L1_MAX_ENTRIES': 1000,
+            # Столько секунд процесс может не видеть изменений,
+            # сделанных другими воркерами.
+            'L1_TIMEOUT': 5,
+            # Версии лент и счётчиков, метки графа подписок, режим
+            # лент, сессии и пользователи читаются только из L2:
+            # старое значение в L1 отдало бы устаревшую страницу,
+            # 304 или уже закрытую сессию.
+            'L2_ONLY': (
+                'posts:feed_version',
+                'posts:count_version',
+                'posts:follow_graph:',
+                'posts:fanout_on_read_authors',
+                'django.contrib.sessions.',
+                'users:user:',
+            ),
+            'STALE_TIMEOUT': 60,
+            'LOCK_TIMEOUT': 10,
+        },
+    },
+    # Общий для всех процессов кэш. В разработке хватает памяти,
+    # в бою файлы видят все воркеры gunicorn на машине; add и incr
+    # у него атомарны, на них держатся замки и версии лент.
+    'shared': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'LOCATION': 'shared',
+    } if DEBUG else {
+        'BACKEND': 'core.cache.AtomicFileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+    },
 }